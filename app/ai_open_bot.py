@@ -1,44 +1,86 @@
-import pandas as pd
-import numpy as np
-from app.prediction_engine import PredictionEngine
+from app.prediction_engine import PredictionEngine, get_prediction_engine
 from app.stats_calculator import StatsCalculator
 from app.text_tables import TextTableFormatter
-from openai import OpenAI
+from app.team_matcher import TeamMatcher
+from app.lazy_facts import LazyFacts
+from app.prompt_builder import PromptBuilder, count_tokens
+from app.data_loader import loader
+from app.executor import run_blocking
+from app.simple_cache import make_cache_key, get_or_compute, aget_or_compute
+from openai import OpenAI, AsyncOpenAI
+import asyncio
+import hashlib
 import os
+from functools import partial
+import time
+from typing import Awaitable, Callable, Optional
+
+# Параметры доступа к GPT: адрес можно переопределить (например, на локальную заглушку OpenAI API)
+VSEGPT_BASE_URL = os.getenv("VSEGPT_BASE_URL", "https://api.vsegpt.ru/v1")
+VSEGPT_MODEL = os.getenv("VSEGPT_MODEL", "gpt-3.5-turbo")
+AI_TIMEOUT = float(os.getenv("KHL_AI_TIMEOUT", "30"))
+AI_MAX_RETRIES = int(os.getenv("KHL_AI_MAX_RETRIES", "3"))
+AI_MAX_CONCURRENCY = int(os.getenv("KHL_AI_MAX_CONCURRENCY", "4"))
 
 class KHL_AIBot:
-    def __init__(self):
-        self.df = pd.read_csv("data/KHL_v1.csv")
+    def __init__(self, stats_calc: StatsCalculator = None, prediction_engine: PredictionEngine = None):
+        # Общий очищенный набор данных DataLoader — без повторного чтения CSV
+        self.df = loader.dataset.df
         print(f"📊 Загружено {len(self.df)} матчей КХЛ")
         
-        self.stats_calc = StatsCalculator(self.df)
-        self.prediction_engine = PredictionEngine(self.df)
+        # Переиспользуем уже созданные калькулятор и обученную модель
+        self.stats_calc = stats_calc or StatsCalculator(loader.dataset)
+        self.prediction_engine = prediction_engine or get_prediction_engine(loader.dataset)
         self.table_formatter = TextTableFormatter()
         
         self.api_key = os.getenv("VSEGPT_API_KEY")
+        # Повторы с экспоненциальной задержкой (429/5xx/обрывы) выполняет сам клиент openai
         self.client = OpenAI(
             api_key=self.api_key,
-            base_url="https://api.vsegpt.ru/v1"
+            base_url=VSEGPT_BASE_URL,
+            timeout=AI_TIMEOUT,
+            max_retries=AI_MAX_RETRIES
         )
         
-        self.gpt_model = "gpt-3.5-turbo"
+        # Один асинхронный клиент на бота — один общий пул keep-alive соединений
+        self.async_client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=VSEGPT_BASE_URL,
+            timeout=AI_TIMEOUT,
+            max_retries=AI_MAX_RETRIES
+        )
+        self._ai_semaphore = None
+        
+        self.gpt_model = VSEGPT_MODEL
         
         self.all_teams = sorted(set(self.df['HOMETEAM'].tolist() + self.df['AWAYTEAM'].tolist()))
+        self.last_seasons = self._last_seasons(self.df)
+        self.team_matcher = TeamMatcher(self.all_teams, last_seasons=self.last_seasons)
+        self.prompt_builder = PromptBuilder(model=self.gpt_model)
+    
+    def set_calculator(self, stats_calc: StatsCalculator):
+        """Переключение на калькулятор с новыми данными (после дописывания матчей)"""
+        teams = sorted(set(stats_calc.df['HOMETEAM'].tolist() + stats_calc.df['AWAYTEAM'].tolist()))
+        last_seasons = self._last_seasons(stats_calc.df)
+        if teams != self.all_teams or last_seasons != self.last_seasons:
+            self.all_teams = teams
+            self.last_seasons = last_seasons
+            self.team_matcher = TeamMatcher(teams, last_seasons=last_seasons)
+        self.df = stats_calc.df
+        self.stats_calc = stats_calc
+    
+    @staticmethod
+    def _last_seasons(df) -> dict:
+        """Последний сезон каждой команды — по нему матчер выбирает название переименованного клуба"""
+        seasons = {}
+        for column in ('HOMETEAM', 'AWAYTEAM'):
+            for team, season in df.groupby(column, observed=True)['SEASON'].max().items():
+                seasons[team] = max(seasons.get(team, 0), int(season))
+        return seasons
     
     def extract_teams_from_query(self, query: str) -> list[str]:
-        query_lower = query.lower()
-        found_teams = []
-        
-        for team in self.all_teams:
-            team_lower = team.lower()
-            if team_lower in query_lower:
-                found_teams.append(team)
-            
-            elif any(part in query_lower for part in team_lower.split()):
-                if len(team_lower) > 3:
-                    found_teams.append(team)
-        
-        return list(set(found_teams))
+        # Команды в порядке упоминания, без повторов
+        return self.team_matcher.extract(query)
     
     def extract_season_from_query(self, query: str):
         
@@ -80,51 +122,86 @@ class KHL_AIBot:
         
         return False
     
-    def get_info_for_question(self, query: str) -> dict:
-        info = {
-            "query": query,
-            "teams_found": [],
-            "season_found": None,
-            "team_stats": {},
-            "h2h_stats": {},
-            "prediction_data": {},
-            "season_stats": {},
-            "top_stats": {},
-            "show_table_directly": self.should_show_table_directly(query)
-        }
-
+    def get_info_for_question(self, query: str) -> LazyFacts:
+        """Факты для ответа. Статистика считается лениво — только то, что прочтёт выбранный путь ответа"""
         teams = self.extract_teams_from_query(query)
-        info["teams_found"] = teams
-        
         season = self.extract_season_from_query(query)
-        info["season_found"] = season or "all"
+        show_table = self.should_show_table_directly(query)
+        
+        # Статистика — по всем названиям клуба (переименованные клубы), подписи — по основному
+        clubs = {team: self.team_matcher.club(team) for team in teams}
         
+        team_stats = LazyFacts()
         for team in teams:
-            info["team_stats"][team] = self.stats_calc.get_team_stats(team, season)
-            info["team_stats"][f"{team}_home"] = self.stats_calc.get_home_stats(team, season)
-            info["team_stats"][f"{team}_away"] = self.stats_calc.get_away_stats(team, season)
-            info["team_stats"][f"{team}_form"] = self.stats_calc.get_form_stats(team, 10)
+            club = clubs[team]
+            team_stats.add(team, partial(self.stats_calc.get_team_stats, club, season))
+            team_stats.add(f"{team}_home", partial(self.stats_calc.get_home_stats, club, season))
+            team_stats.add(f"{team}_away", partial(self.stats_calc.get_away_stats, club, season))
+            team_stats.add(f"{team}_form", partial(self.stats_calc.get_form_stats, club, 10))
+        
+        # Статистика по сезону
+        season_stats = LazyFacts()
+        if season or show_table:
+            season_to_use = season or "all"
+            season_stats.add("table", partial(self.stats_calc.get_season_table, season_to_use))
+            season_stats.add("top_winners", partial(self.stats_calc.get_top_winners, season_to_use, 10))
+            season_stats.add("top_points", partial(self.stats_calc.get_top_points, season_to_use, 10))
+            season_stats.add("top_scorers", partial(self.stats_calc.get_top_goal_scorers, season_to_use, 10))
+            season_stats.add("top_winrate", partial(self.stats_calc.get_top_winrate, season_to_use, min_games=10, limit=10))
+        
+        info = LazyFacts({
+            "query": query,
+            "teams_found": teams,
+            "team_clubs": clubs,
+            "season_found": season or "all",
+            "team_stats": team_stats,
+            "h2h_stats": {},
+            "prediction_data": {},
+            "season_stats": season_stats,
+            "top_stats": {},
+            "show_table_directly": show_table
+        })
         
         if len(teams) >= 2:
             team1, team2 = teams[0], teams[1]
-            info["h2h_stats"] = self.stats_calc.get_head_to_head(team1, team2, season)
-            
-            try:
-                info["prediction_data"] = self.prediction_engine.predict_match(team1, team2)
-            except:
-                info["prediction_data"] = {}
+            info.add("h2h_stats", partial(self.stats_calc.get_head_to_head, clubs[team1], clubs[team2], season))
+            info.add("prediction_data", partial(self._safe_predict, team1, team2))
         
-        # Собираем статистику по сезону
-        if season or info["show_table_directly"]:
-            season_to_use = season or "all"
-            info["season_stats"]["table"] = self.stats_calc.get_season_table(season_to_use)
-            info["season_stats"]["top_winners"] = self.stats_calc.get_top_winners(season_to_use, 10)
-            info["season_stats"]["top_points"] = self.stats_calc.get_top_points(season_to_use, 10)
-            info["season_stats"]["top_scorers"] = self.stats_calc.get_top_goal_scorers(season_to_use, 10)
-            info["season_stats"]["top_winrate"] = self.stats_calc.get_top_winrate(season_to_use, min_games=10, limit=10)
+        # Упакованные под бюджет факты промпта — общие для ключа кэша и самого промпта
+        info.add("prompt_facts", partial(self.pack_facts, info))
         
         return info
     
+    def _safe_predict(self, team1: str, team2: str) -> dict:
+        try:
+            return self.prediction_engine.predict_match(team1, team2)
+        except:
+            return {}
+    
+    def answer_cache_key(self, info: dict) -> str:
+        """Ключ ответа GPT по намерению: поколение данных, команды, сезон, флаг таблицы и хеш данных промпта.
+
+        Текст вопроса в ключ не входит — разные формулировки одного вопроса дают один ответ.
+        Версия набора данных тоже не входит: новые матчи меняют хеш только затронутых ответов.
+        """
+        # Хешируем ровно те данные, что уходят в промпт, — лишние факты при этом не считаются
+        digest = hashlib.sha256(self.format_facts_for_gpt(info).encode("utf-8")).hexdigest()[:16]
+        
+        return make_cache_key(
+            "ai_answer",
+            self.stats_calc.cache_version,
+            ",".join(sorted(info["teams_found"])) or "-",
+            info["season_found"],
+            int(bool(info["show_table_directly"])),
+            digest
+        )
+    
+    def answer_cache_tags(self, info: dict) -> set:
+        """Теги ответа для invalidate_tags: все названия клубов и сезон (или "all")"""
+        clubs = info.get("team_clubs", {})
+        names = {name for team in info["teams_found"] for name in clubs.get(team, (team,))}
+        return names | {str(info["season_found"] or "all")}
+    
     def generate_table_response(self, info: dict) -> str:
 
         if not info.get("season_stats", {}).get("table"):
@@ -154,7 +231,7 @@ class KHL_AIBot:
         
         return response
     
-    def generate_ai_response(self, query: str, info: dict) -> str:
+    def build_messages(self, query: str, info: dict) -> list[dict]:
         
         system_prompt = """Ты - эксперт по статистике Континентальной хоккейной лиги (КХЛ). 
 Ты получаешь данные о матчах, статистику команд и прогнозы. 
@@ -193,29 +270,113 @@ class KHL_AIBot:
 Пожалуйста, дай подробный и информативный ответ на вопрос пользователя, используя предоставленную статистику.
 Включай конкретные цифры, проценты и интересные статистические закономерности."""
 
+        print(f"🧮 Промпт: {count_tokens(system_prompt, self.gpt_model) + count_tokens(user_prompt, self.gpt_model)} токенов")
+        
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+    
+    def generate_ai_response(self, query: str, info: dict) -> str:
         try:
             response = self.client.chat.completions.create(
                 model=self.gpt_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                messages=self.build_messages(query, info),
                 temperature=0.3,
                 max_tokens=1200
             )
             
-            return response.choices[0].message.content
+            text = response.choices[0].message.content
+            # Пустой ответ не кэшируем
+            return text if (text or "").strip() else None
             
         except Exception as e:
             print(f"Ошибка при запросе к GPT: {e}")
             return 
     
-    def format_info_for_gpt(self, info: dict) -> str:
-
-        formatted = []
+    async def agenerate_ai_response(self, query: str, info: dict,
+                                    on_delta: Optional[Callable[[str], Awaitable[None]]] = None) -> Optional[str]:
+        """Асинхронный запрос к GPT; с on_delta ответ стримится, on_delta получает накопленный текст"""
+        if self._ai_semaphore is None:
+            self._ai_semaphore = asyncio.Semaphore(AI_MAX_CONCURRENCY)
         
-        formatted.append(f"Запрос пользователя: {info['query']}")
+        messages = self.build_messages(query, info)
         
+        try:
+            async with self._ai_semaphore:
+                start = time.time()
+                
+                if on_delta is None:
+                    response = await self.async_client.chat.completions.create(
+                        model=self.gpt_model,
+                        messages=messages,
+                        temperature=0.3,
+                        max_tokens=1200
+                    )
+                    text = response.choices[0].message.content
+                else:
+                    stream = await self.async_client.chat.completions.create(
+                        model=self.gpt_model,
+                        messages=messages,
+                        temperature=0.3,
+                        max_tokens=1200,
+                        stream=True
+                    )
+                    parts = []
+                    async for chunk in stream:
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            parts.append(delta)
+                            await on_delta("".join(parts))
+                    text = "".join(parts)
+                
+                # Пустой ответ — None: get_or_compute его не кэширует, следующий вопрос снова пойдёт в GPT
+                if not (text or "").strip():
+                    print(f"⚠️ GPT вернул пустой ответ за {time.time() - start:.1f} с")
+                    return None
+                
+                print(f"✅ Ответ GPT получен за {time.time() - start:.1f} с")
+                return text
+            
+        except Exception as e:
+            print(f"Ошибка при запросе к GPT: {e}")
+            return 
+    
+    def format_info_for_gpt(self, info: dict) -> str:
+        facts = self.format_facts_for_gpt(info)
+        return "\n".join([f"Запрос пользователя: {info['query']}"] + ([facts] if facts else []))
+    
+    def format_facts_for_gpt(self, info: dict) -> str:
+        """Статистическая часть промпта (без текста вопроса) в пределах бюджета токенов"""
+        if "prompt_facts" in info:
+            return info["prompt_facts"]["text"]
+        return self.pack_facts(info)["text"]
+    
+    def pack_facts(self, info: dict) -> dict:
+        packed = self.prompt_builder.pack(self.rank_facts(info))
+        print(f"🧮 Факты для GPT: {packed['tokens']}/{packed['budget']} токенов, "
+              f"взято {len(packed['included'])}, отброшено {len(packed['dropped'])}")
+        return packed
+    
+    def rank_facts(self, info: dict) -> list:
+        """Факты промпта с приоритетом по намерению вопроса (меньше — важнее)"""
+        teams = info["teams_found"]
+        matchup = len(teams) >= 2
+        season_question = info["season_found"] != "all" and not teams
+        
+        facts = [("header", 0, partial(self._fact_header, info))]
+        for rank, team in enumerate(teams):
+            # Первые две команды — основа вопроса, остальные — по мере места
+            facts.append((f"team:{team}", 1 if rank < 2 else 3 + rank, partial(self._fact_team, info, team)))
+        facts.append(("h2h", 1 if matchup else 5, partial(self._fact_h2h, info)))
+        facts.append(("prediction", 2, partial(self._fact_prediction, info)))
+        facts.append(("season", 1 if season_question else 4, partial(self._fact_season, info)))
+        return facts
+    
+    def _fact_header(self, info: dict) -> str:
+        formatted = []
         
         if info["teams_found"]:
             formatted.append(f"\nНайдены команды: {', '.join(info['teams_found'])}")
@@ -223,45 +384,59 @@ class KHL_AIBot:
         if info["season_found"] and info["season_found"] != "all":
             formatted.append(f"Сезон: {info['season_found']}")
         
-        # Статистика команд
-        for team, stats in info["team_stats"].items():
-            if stats and isinstance(stats, dict) and team in info["teams_found"]:
-                formatted.append(f"\nСтатистика команды {team}:")
-                if 'games' in stats:
-                    formatted.append(f"  Матчей: {stats.get('games', 'нет данных')}")
-                    formatted.append(f"  Побед: {stats.get('wins', 'нет данных')} ({stats.get('win_rate', 'нет данных')})")
-                    formatted.append(f"  Голы: забито {stats.get('goals_scored', 'нет данных')}, пропущено {stats.get('goals_conceded', 'нет данных')}")
-                    formatted.append(f"  Разница голов: {stats.get('goal_difference', 'нет данных')}")
-                    formatted.append(f"  Очки: {stats.get('points', 'нет данных')}")
-        
-        # H2H статистика
-        if info["h2h_stats"]:
-            h2h = info["h2h_stats"]
-            formatted.append(f"\nВстречи {h2h.get('team1', '')} vs {h2h.get('team2', '')}:")
-            formatted.append(f"  Всего матчей: {h2h.get('total_games', 0)}")
-            formatted.append(f"  Побед {h2h.get('team1', '')}: {h2h.get('team1_wins', 0)} ({h2h.get('team1_winrate', 'нет данных')})")
-            formatted.append(f"  Побед {h2h.get('team2', '')}: {h2h.get('team2_wins', 0)} ({h2h.get('team2_winrate', 'нет данных')})")
-        
-        # Прогноз
-        if info["prediction_data"] and "prediction" in info["prediction_data"]:
-            pred = info["prediction_data"]["prediction"]
-            probs = info["prediction_data"].get("probabilities", {})
-            
-            formatted.append("\nПрогноз на матч:")
-            formatted.append(f"  {pred.get('description', 'нет данных')}")
-            if probs:
-                formatted.append(f"  Вероятности: победа хозяев {probs.get('home_win', 0):.1%}, победа гостей {probs.get('away_win', 0):.1%}")
+        return "\n".join(formatted)
+    
+    def _fact_team(self, info: dict, team: str) -> str:
+        stats = info["team_stats"].get(team)
+        if not stats or not isinstance(stats, dict):
+            return ""
+        
+        formatted = [f"\nСтатистика команды {team}:"]
+        if 'games' in stats:
+            formatted.append(f"  Матчей: {stats.get('games', 'нет данных')}")
+            formatted.append(f"  Побед: {stats.get('wins', 'нет данных')} ({stats.get('win_rate', 'нет данных')})")
+            formatted.append(f"  Голы: забито {stats.get('goals_scored', 'нет данных')}, пропущено {stats.get('goals_conceded', 'нет данных')}")
+            formatted.append(f"  Разница голов: {stats.get('goal_difference', 'нет данных')}")
+            formatted.append(f"  Очки: {stats.get('points', 'нет данных')}")
+        return "\n".join(formatted)
+    
+    def _fact_h2h(self, info: dict) -> str:
+        h2h = info["h2h_stats"]
+        if not h2h:
+            return ""
+        
+        return "\n".join([
+            f"\nВстречи {h2h.get('team1', '')} vs {h2h.get('team2', '')}:",
+            f"  Всего матчей: {h2h.get('total_games', 0)}",
+            f"  Побед {h2h.get('team1', '')}: {h2h.get('team1_wins', 0)} ({h2h.get('team1_winrate', 'нет данных')})",
+            f"  Побед {h2h.get('team2', '')}: {h2h.get('team2_wins', 0)} ({h2h.get('team2_winrate', 'нет данных')})"
+        ])
+    
+    def _fact_prediction(self, info: dict) -> str:
+        if not info["prediction_data"] or "prediction" not in info["prediction_data"]:
+            return ""
         
-        # Информация о сезоне (для GPT, но не полная таблица)
-        if info["season_stats"].get("table"):
-            table = info["season_stats"]["table"]
-            formatted.append(f"\nИнформация о сезоне {info['season_found']}:")
-            formatted.append(f"  Всего команд: {len(table)}")
-            if table:
-                formatted.append(f"  Лидер: {table[0]['team']} с {table[0]['points']} очками")
-                if len(table) > 1:
-                    formatted.append(f"  Второе место: {table[1]['team']} с {table[1]['points']} очками")
+        pred = info["prediction_data"]["prediction"]
+        probs = info["prediction_data"].get("probabilities", {})
         
+        formatted = ["\nПрогноз на матч:", f"  {pred.get('description', 'нет данных')}"]
+        if probs:
+            formatted.append(f"  Вероятности: победа хозяев {probs.get('home_win', 0):.1%}, победа гостей {probs.get('away_win', 0):.1%}")
+        return "\n".join(formatted)
+    
+    def _fact_season(self, info: dict) -> str:
+        # Информация о сезоне (для GPT, но не полная таблица)
+        table = info["season_stats"].get("table")
+        if not table:
+            return ""
+        
+        formatted = [
+            f"\nИнформация о сезоне {info['season_found']}:",
+            f"  Всего команд: {len(table)}",
+            f"  Лидер: {table[0]['team']} с {table[0]['points']} очками"
+        ]
+        if len(table) > 1:
+            formatted.append(f"  Второе место: {table[1]['team']} с {table[1]['points']} очками")
         return "\n".join(formatted)
     
     def format_team_stats_fallback(self, team: str, info: dict) -> str:
@@ -347,7 +522,27 @@ class KHL_AIBot:
         
         print(f"📊 Собрано данных: {len(info['teams_found'])} команд, сезон: {info['season_found']}")
         
-        response = self.generate_ai_response(query, info)
+        # Повторный вопрос с тем же намерением отдаём из кэша без запроса к GPT
+        return get_or_compute(self.answer_cache_key(info), lambda: self.generate_ai_response(query, info),
+                              tags=self.answer_cache_tags(info))
+    
+    async def aask(self, query: str, on_delta: Optional[Callable[[str], Awaitable[None]]] = None) -> Optional[str]:
+        """Асинхронный ask: сбор статистики — в пуле потоков, запрос к GPT — через AsyncOpenAI"""
+        print(f"\n🧐 Вопрос: {query}")
+        
+        info = await run_blocking("stats", self.get_info_for_question, query)
         
-        return response
+        # Факты ленивые: читающие их шаги тоже выполняем в пуле, а не в цикле событий
+        if info.get("show_table_directly"):
+            print("📋 Показываем таблицу напрямую")
+            return await run_blocking("stats", self.generate_table_response, info)
+        
+        print(f"📊 Собрано данных: {len(info['teams_found'])} команд, сезон: {info['season_found']}")
+        
+        cache_key = await run_blocking("stats", self.answer_cache_key, info)
+        return await aget_or_compute(cache_key, lambda: self.agenerate_ai_response(query, info, on_delta),
+                                     tags=self.answer_cache_tags(info))
+    
+    async def aclose(self):
+        await self.async_client.close()
     
\ No newline at end of file
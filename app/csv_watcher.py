@@ -0,0 +1,104 @@
+import asyncio
+import io
+import logging
+import os
+from typing import Dict, Optional
+
+import pandas as pd
+
+from app.data_loader import DataLoader, file_sha256
+from app.executor import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# Период проверки CSV на новые строки
+CSV_WATCH_INTERVAL = int(os.getenv("KHL_CSV_WATCH_INTERVAL", "30"))
+
+
+class CsvWatcher:
+    """Следит за CSV: дописанные в конец строки передаёт в DataLoader.append_matches,
+    любое другое изменение — в DataLoader.reload.
+
+    Для дописанных строк весь файл не перечитывается: проверяется, что прежнее содержимое
+    не изменилось (sha256 первых size байт), и разбирается только хвост до последней полной строки.
+    Перезагрузка начинается, когда файл не менялся между двумя проверками, — чтобы не читать
+    его посреди записи.
+    """
+
+    def __init__(self, loader: DataLoader):
+        self.loader = loader
+        # (размер, mtime) изменённого файла с прошлой проверки и файла, который не удалось загрузить
+        self._pending = None
+        self._failed = None
+
+    def check(self) -> Optional[Dict]:
+        """Одна проверка; отчёт append_matches, если были новые строки, иначе None"""
+        meta = self.loader.source_meta
+        if meta is None:
+            return None
+
+        path = self.loader.data_path
+        stat = os.stat(path)
+        if stat.st_size == meta['size'] and stat.st_mtime_ns == meta['mtime_ns']:
+            return None
+
+        if stat.st_size < meta['size'] or file_sha256(path, limit=meta['size']) != meta['sha256']:
+            return self._reload((stat.st_size, stat.st_mtime_ns))
+
+        if stat.st_size == meta['size']:
+            # Содержимое то же, изменилось только время модификации
+            self.loader.source_meta = dict(meta, mtime_ns=stat.st_mtime_ns)
+            return None
+
+        with open(path, 'rb') as f:
+            header = f.readline()
+            f.seek(meta['size'])
+            tail = f.read(stat.st_size - meta['size'])
+
+        # Последняя строка может быть ещё не дописана — берём только полные
+        end = tail.rfind(b'\n') + 1
+        if end == 0:
+            return None
+
+        rows = pd.read_csv(
+            io.BytesIO(header + tail[:end]),
+            encoding='utf-8-sig',
+            # Лишние поля в строке не превращают первую колонку в индекс
+            index_col=False,
+            on_bad_lines='warn',
+            skipinitialspace=True
+        )
+        consumed = meta['size'] + end
+        source_meta = dict(
+            meta,
+            size=consumed,
+            mtime_ns=stat.st_mtime_ns,
+            sha256=file_sha256(path, limit=consumed)
+        )
+
+        logger.info(f"📥 В {path} дописано строк: {len(rows)}")
+        return self.loader.append_matches(rows, source_meta=source_meta)
+
+    def _reload(self, state) -> Optional[Dict]:
+        if state == self._failed:
+            return None
+        if state != self._pending:
+            logger.info(f"📝 {self.loader.data_path} изменён — перезагрузка при следующей проверке, если запись закончена")
+            self._pending = state
+            return None
+
+        self._pending = None
+        report = self.loader.reload()
+        if report is None:
+            # Не повторяем, пока файл не изменится снова
+            self._failed = state
+        return report
+
+    async def watch(self, interval: int = CSV_WATCH_INTERVAL):
+        """Периодическая проверка в пуле потоков, пока задачу не отменят"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await run_blocking("ingest", self.check)
+            except Exception as e:
+                logger.error(f"❌ Ошибка проверки CSV: {e}", exc_info=True)
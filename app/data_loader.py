@@ -1,129 +1,699 @@
 import pandas as pd
+import numpy as np
+import datetime
+import hashlib
+import json
 import logging
+import os
 import re
+import threading
+import time
+from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
+# Общий фрейм не копируется потребителями: с Copy-on-Write запись в производный
+# фрейм создаёт собственную копию (в pandas >= 3.0 режим включён всегда)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+
+class TeamIndex:
+    """Инвертированный индекс: команда / (команда, сезон) / пара команд -> позиции строк для iloc"""
+    
+    EMPTY = np.empty(0, dtype=np.int64)
+    EMPTY.flags.writeable = False
+    
+    def __init__(self, df: pd.DataFrame, base: 'TeamIndex' = None, start: int = 0):
+        """Индекс строк df[start:]; с base — дополнение индекса base, построенного по df[:start]"""
+        teams = list(df['HOMETEAM'].cat.categories)
+        home_ids = df['HOME_ID'].to_numpy()[start:]
+        away_ids = df['AWAY_ID'].to_numpy()[start:]
+        self._seasons = df['SEASON'].to_numpy()
+        rows = np.arange(start, len(df), dtype=np.int64)
+        
+        # Команда -> все её игры (дома и в гостях), позиции по возрастанию
+        codes = np.concatenate([home_ids, away_ids])
+        positions = np.concatenate([rows, rows])
+        valid = codes >= 0
+        codes, positions = codes[valid], positions[valid]
+        order = np.lexsort((positions, codes))
+        self.by_team = self._group(codes[order], positions[order], teams)
+        
+        # (команда, сезон) -> позиции
+        seasons = self._seasons[positions]
+        order = np.lexsort((positions, seasons, codes))
+        self.by_team_season = {}
+        for team, team_positions in self._group(codes[order], positions[order], teams).items():
+            team_seasons = self._seasons[team_positions]
+            bounds = np.flatnonzero(np.diff(team_seasons)) + 1
+            for chunk in np.split(team_positions, bounds):
+                self.by_team_season[(team, int(self._seasons[chunk[0]]))] = chunk
+        
+        # Пара команд (в алфавитном порядке) -> позиции личных встреч;
+        # после дописанных матчей коды новых команд идут не по алфавиту, поэтому сортируем имена
+        valid = (home_ids >= 0) & (away_ids >= 0)
+        low = np.minimum(home_ids, away_ids)[valid]
+        high = np.maximum(home_ids, away_ids)[valid]
+        pair_rows = rows[valid]
+        pair_codes = low.astype(np.int64) * len(teams) + high
+        order = np.lexsort((pair_rows, pair_codes))
+        pair_codes, pair_rows = pair_codes[order], pair_rows[order]
+        bounds = np.flatnonzero(np.diff(pair_codes)) + 1
+        self.by_pair = {}
+        for chunk_codes, chunk in zip(np.split(pair_codes, bounds), np.split(pair_rows, bounds)):
+            if len(chunk) == 0:
+                continue
+            low_code, high_code = divmod(int(chunk_codes[0]), len(teams))
+            chunk.flags.writeable = False
+            self.by_pair[tuple(sorted((teams[low_code], teams[high_code])))] = chunk
+        
+        if base is not None:
+            self.by_team = self._merge(base.by_team, self.by_team)
+            self.by_team_season = self._merge(base.by_team_season, self.by_team_season)
+            self.by_pair = self._merge(base.by_pair, self.by_pair)
+    
+    @classmethod
+    def extended(cls, base: 'TeamIndex', df: pd.DataFrame, start: int) -> 'TeamIndex':
+        """Индекс df, где строки [0, start) уже проиндексированы в base: обрабатываются только новые"""
+        return cls(df, base=base, start=start)
+    
+    @staticmethod
+    def _merge(old, new):
+        # Неизменённые ключи — те же массивы; новые позиции больше старых, порядок сохраняется
+        merged = dict(old)
+        for key, chunk in new.items():
+            if key in merged:
+                chunk = np.concatenate([merged[key], chunk])
+                chunk.flags.writeable = False
+            merged[key] = chunk
+        return merged
+    
+    @staticmethod
+    def _group(codes, positions, teams):
+        groups = {}
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        for chunk_codes, chunk in zip(np.split(codes, bounds), np.split(positions, bounds)):
+            if len(chunk) == 0:
+                continue
+            chunk.flags.writeable = False
+            groups[teams[chunk_codes[0]]] = chunk
+        return groups
+    
+    def team(self, team_name, season=None) -> np.ndarray:
+        """Позиции игр команды (опционально в сезоне)"""
+        if season is None or season == "all":
+            return self.by_team.get(team_name, self.EMPTY)
+        return self.by_team_season.get((team_name, int(season)), self.EMPTY)
+    
+    def pair(self, team1, team2, season=None) -> np.ndarray:
+        """Позиции личных встреч двух команд (опционально в сезоне)"""
+        positions = self.by_pair.get(tuple(sorted((team1, team2))), self.EMPTY)
+        if season is None or season == "all" or len(positions) == 0:
+            return positions
+        return positions[self._seasons[positions] == int(season)]
+
+
+def file_sha256(path, limit: int = None) -> str:
+    """SHA-256 содержимого файла (отпечаток исходных данных); с limit — только первых limit байт"""
+    digest = hashlib.sha256()
+    remaining = limit
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(1 << 20 if remaining is None else min(1 << 20, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+class Dataset:
+    """Очищенные данные и индексы — один экземпляр на процесс, общий для всех потребителей (только чтение)"""
+    
+    def __init__(self, df: pd.DataFrame, version: int = 1, fingerprint: str = None, index: TeamIndex = None,
+                 generation: int = 1):
+        self.df = df
+        # Отпечаток исходного CSV — ключ для артефактов, построенных по этим данным
+        self.fingerprint = fingerprint
+        self.teams = list(df['HOMETEAM'].cat.categories)
+        self.team_codes = {team: code for code, team in enumerate(self.teams)}
+        self.seasons = sorted(int(s) for s in df['SEASON'].unique())
+        # Готовый индекс передаётся при дописывании матчей (TeamIndex.extended)
+        self.index = index if index is not None else TeamIndex(df)
+        # version растёт при любом изменении данных, generation — только при полной перезагрузке CSV.
+        # generation входит в ключи кэша: записи прежней загрузки просто перестают читаться и истекают по TTL,
+        # а после дописывания матчей сбрасываются только затронутые записи (invalidate_tags)
+        self.version = version
+        self.generation = generation
+    
+    def __len__(self):
+        return len(self.df)
+
+
 class DataLoader:
+    # Версия формата снимка очищенных данных: при изменении очистки — увеличить
+    SNAPSHOT_VERSION = 1
+    # Обязательные поля дописываемого матча
+    APPEND_COLUMNS = ['DATE', 'SEASON', 'HOMETEAM', 'AWAYTEAM', 'HG', 'AG']
     
-    def __init__(self, data_path="data/KHL_v1.csv"):
+    def __init__(self, data_path="data/KHL_v1.csv", snapshot_path=None):
         self.data_path = data_path
-        self.df = None
-        self.teams = []
-        self.seasons = []
+        # Снимок очищенного фрейма рядом с CSV: data/cache/KHL_v1.snapshot.pkl
+        self.snapshot_path = snapshot_path or os.path.join(
+            os.path.dirname(data_path), "cache",
+            os.path.splitext(os.path.basename(data_path))[0] + ".snapshot.pkl"
+        )
+        self._df = None
+        self._teams = []
+        self.team_codes = {}
+        self._index = None
+        self._dataset = None
+        self._seasons = []
         self.raw_row_count = 0
         self.processed_row_count = 0
+        self.load_timings = {}
+        self._init_lock = threading.RLock()
+        # Одна фоновая перезагрузка за раз
+        self._reload_lock = threading.Lock()
+        self._initialized = False
+        # Метаданные CSV, по которому построены текущие данные (размер, mtime, sha256)
+        self.source_meta = None
+        # Ключи (дата, хозяева, гости) загруженных матчей — для отсева дублей при дописывании
+        self._match_keys = None
+        self._listeners = []
+    
+    def init(self):
+        """Однократная загрузка данных (идемпотентно и потокобезопасно)"""
+        if self._initialized:
+            return self._dataset is not None
+        
+        with self._init_lock:
+            if not self._initialized:
+                self.load()
+                self._initialized = True
+        return self._dataset is not None
+    
+    @property
+    def df(self):
+        self.init()
+        return self._df
+    
+    @property
+    def teams(self):
+        self.init()
+        return self._teams
+    
+    @property
+    def seasons(self):
+        self.init()
+        return self._seasons
+    
+    @property
+    def index(self):
+        self.init()
+        return self._index
+    
+    @property
+    def dataset(self):
+        self.init()
+        return self._dataset
+    
+    @contextmanager
+    def _phase(self, name):
+        phase_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.load_timings[name] = (time.perf_counter() - phase_start) * 1000
+            logger.info(f"⏱ {name}: {self.load_timings[name]:.1f} мс")
     
     def load(self):
+        """Полная (пере)загрузка данных; обычно вызывается через init()"""
+        with self._init_lock:
+            return self._load()
+    
+    # Состояние, которое подменяется целиком при перезагрузке (_dataset — последним)
+    _STATE = ('_df', 'team_codes', '_teams', '_seasons', '_index', 'raw_row_count', 'processed_row_count',
+              'load_timings', 'source_meta', '_match_keys', '_dataset')
+    
+    def reload(self):
+        """Полная перезагрузка изменённого CSV без остановки бота.
+        
+        Новые фрейм, индекс и метаданные собираются отдельным загрузчиком, пока запросы
+        обслуживаются текущими данными; затем состояние подменяется под блокировкой,
+        и подписчики получают (старый набор, новый набор, отчёт с reload=True).
+        Матчи, дописанные через append_matches, но отсутствующие в CSV, при этом теряются.
+        Возвращает отчёт или None, если загрузить новые данные не удалось (текущие остаются).
+        """
+        with self._reload_lock:
+            old = self.dataset
+            staging = DataLoader(self.data_path, self.snapshot_path)
+            # Номера версии и поколения продолжают текущие
+            staging._dataset = old
+            if not staging.load():
+                logger.error("❌ Перезагрузка не удалась — остаются прежние данные")
+                return None
+            
+            with self._init_lock:
+                for attr in self._STATE:
+                    setattr(self, attr, getattr(staging, attr))
+                new = self._dataset
+        
+        report = {
+            'reload': True,
+            'added': len(new) - len(old),
+            'rejected': [],
+            'teams': list(new.teams),
+            'seasons': list(new.seasons),
+            'version': new.version
+        }
+        logger.info(f"🔄 Данные перезагружены: {len(new)} игр, версия {new.version}, поколение {new.generation}")
+        self._notify(old, new, report)
+        return report
+    
+    def _notify(self, old, new, report):
+        for callback in list(self._listeners):
+            try:
+                callback(old, new, report)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработчика обновления данных: {e}", exc_info=True)
+    
+    def _load(self):
         try:
             logger.info(f"Попытка загрузить файл: {self.data_path}")
+            self.load_timings = {}
+            load_start = time.perf_counter()
             
-            # Загружаем с исправлением BOM и обработкой ошибок
-            self.df = pd.read_csv(
-                self.data_path, 
-                encoding='utf-8-sig',  # Для обработки BOM символа
-                on_bad_lines='warn',
-                skipinitialspace=True
-            )
+            with self._phase("fingerprint"):
+                source_meta = self._source_meta()
             
-            # Убираем BOM символы из названий колонок
-            self.df.columns = [col.strip().replace('\ufeff', '') for col in self.df.columns]
+            # Быстрый путь: снимок уже очищенных данных, если CSV не менялся
+            with self._phase("snapshot"):
+                from_snapshot = self._load_snapshot(source_meta)
+            if not from_snapshot:
+                with self._phase("csv+clean"):
+                    if not self._load_csv():
+                        return False
+                with self._phase("save_snapshot"):
+                    self._save_snapshot(source_meta)
             
-            self.raw_row_count = len(self.df)
-            logger.info(f"Загружено строк: {self.raw_row_count}")
+            # Проверяем уникальность команд
+            with self._phase("metadata"):
+                self._get_metadata()
             
-            # Проверяем наличие необходимых колонок
-            required_columns = ['HG', 'AG', 'HOMETEAM', 'AWAYTEAM', 'SEASON']
-            missing_columns = [col for col in required_columns if col not in self.df.columns]
+            # Общий набор данных с индексом позиций строк по командам, сезонам и парам
+            with self._phase("index"):
+                version = self._dataset.version + 1 if self._dataset is not None else 1
+                generation = self._dataset.generation + 1 if self._dataset is not None else 1
+                self._dataset = Dataset(self._df, version, fingerprint=source_meta['sha256'], generation=generation)
+                self._index = self._dataset.index
             
-            if missing_columns:
-                logger.error(f"Отсутствуют колонки: {missing_columns}")
-                logger.info(f"Доступные колонки: {list(self.df.columns)}")
-                return False
+            self.source_meta = source_meta
+            self._match_keys = None
+            self.processed_row_count = len(self._df)
+            self._initialized = True
+            logger.info(f"✅ Данные загружены успешно за {(time.perf_counter() - load_start) * 1000:.1f} мс")
+            logger.info(f"📊 Команд: {len(self._teams)}")
+            logger.info(f"📅 Сезонов: {len(self._seasons)}")
+            logger.info(f"🎯 Сезоны: {sorted(self._seasons)}")
             
-            # ОЧИСТКА ДАННЫХ
-            self._clean_data()
+            return True
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки: {e}", exc_info=True)
+            return False
+    
+    def _load_csv(self):
+        # Загружаем с исправлением BOM и обработкой ошибок
+        self._df = pd.read_csv(
+            self.data_path, 
+            encoding='utf-8-sig',  # Для обработки BOM символа
+            on_bad_lines='warn',
+            skipinitialspace=True
+        )
+        
+        # Убираем BOM символы из названий колонок
+        self._df.columns = [col.strip().replace('\ufeff', '') for col in self._df.columns]
+        
+        self.raw_row_count = len(self._df)
+        logger.info(f"Загружено строк: {self.raw_row_count}")
+        
+        # Проверяем наличие необходимых колонок
+        required_columns = ['HG', 'AG', 'HOMETEAM', 'AWAYTEAM', 'SEASON']
+        missing_columns = [col for col in required_columns if col not in self._df.columns]
+        
+        if missing_columns:
+            logger.error(f"Отсутствуют колонки: {missing_columns}")
+            logger.info(f"Доступные колонки: {list(self._df.columns)}")
+            return False
+        
+        # ОЧИСТКА ДАННЫХ
+        self._clean_data()
+        
+        # Проверяем типы данных
+        logger.info("Типы данных после очистки:")
+        for col in ['SEASON', 'HOMETEAM', 'AWAYTEAM', 'HG', 'AG']:
+            if col in self._df.columns:
+                logger.info(f"  {col}: {self._df[col].dtype}")
+        
+        # Создаем колонку SCORE
+        self._add_score(self._df)
+        return True
+    
+    def subscribe(self, callback):
+        """callback(old_dataset, new_dataset, report) вызывается после дописывания матчей и перезагрузки"""
+        self._listeners.append(callback)
+    
+    def append_matches(self, rows, source_meta=None):
+        """Дописать новые матчи без перезагрузки CSV.
+        
+        rows — список словарей или DataFrame с колонками как в CSV. Строки проверяются,
+        очищаются тем же кодом, что и CSV, и добавляются в конец фрейма; индекс команд
+        дополняется только новыми позициями, версия набора данных увеличивается.
+        source_meta передаёт наблюдатель за CSV, когда строки уже дописаны в файл.
+        
+        Возвращает {'added', 'rejected': [(строка, причина)], 'teams', 'seasons', 'version'}.
+        """
+        if not self.init():
+            raise RuntimeError("Данные не загружены")
+        
+        frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+        frame.columns = [str(col).strip().replace('\ufeff', '') for col in frame.columns]
+        
+        with self._init_lock:
+            old = self._dataset
+            accepted, rejected, keys = self._validate_rows(frame)
+            for row, reason in rejected:
+                logger.warning(f"⚠️ Матч отклонён ({reason}): {row}")
             
-            # Проверяем типы данных
-            logger.info("Типы данных после очистки:")
-            for col in ['SEASON', 'HOMETEAM', 'AWAYTEAM', 'HG', 'AG']:
-                if col in self.df.columns:
-                    logger.info(f"  {col}: {self.df[col].dtype}")
+            report = {'reload': False, 'added': len(accepted), 'rejected': rejected, 'teams': [], 'seasons': [], 'version': old.version}
+            if source_meta is not None:
+                self.source_meta = source_meta
             
-            # Создаем колонку SCORE
-            self.df['SCORE'] = self.df['HG'].astype(str).str.strip() + ':' + self.df['AG'].astype(str).str.strip()
+            if not accepted:
+                if source_meta is not None:
+                    self._save_snapshot(source_meta)
+                return report
             
-            # Проверяем уникальность команд
-            self._get_metadata()
+            new_rows, teams = self._clean_frame(pd.DataFrame(accepted), self._teams)
+            self._add_score(new_rows)
             
-            self.processed_row_count = len(self.df)
-            logger.info(f"✅ Данные загружены успешно")
-            logger.info(f"📊 Команд: {len(self.teams)}")
-            logger.info(f"📅 Сезонов: {len(self.seasons)}")
-            logger.info(f"🎯 Сезоны: {sorted(self.seasons)}")
+            start = len(self._df)
+            df = self._concat(self._df, new_rows, teams)
             
-            return True
+            if source_meta is not None:
+                fingerprint = source_meta['sha256']
+            else:
+                digest = hashlib.sha256((old.fingerprint or '').encode('utf-8'))
+                digest.update(new_rows.to_csv(index=False).encode('utf-8'))
+                fingerprint = digest.hexdigest()
+            
+            dataset = Dataset(df, old.version + 1, fingerprint=fingerprint,
+                              index=TeamIndex.extended(old.index, df, start), generation=old.generation)
+            
+            self._df = df
+            self.team_codes = {team: code for code, team in enumerate(teams)}
+            self._teams = list(teams)
+            self._seasons = dataset.seasons
+            self._dataset = dataset
+            self._index = dataset.index
+            self._match_keys |= keys
+            self.raw_row_count += len(frame)
+            self.processed_row_count = len(df)
+            
+            if source_meta is not None:
+                self._save_snapshot(source_meta)
+            
+            report.update(
+                teams=sorted(set(new_rows['HOMETEAM'].astype(str)) | set(new_rows['AWAYTEAM'].astype(str))),
+                seasons=sorted(int(season) for season in new_rows['SEASON'].unique()),
+                version=dataset.version
+            )
+        
+        logger.info(f"➕ Дописано матчей: {len(accepted)}, отклонено: {len(rejected)}, версия данных {dataset.version}")
+        self._notify(old, dataset, report)
+        return report
+    
+    def _validate_rows(self, frame):
+        """Проверка дописываемых строк: (принятые строки, [(строка, причина)], ключи принятых матчей)"""
+        records = frame.to_dict('records')
+        missing = [col for col in self.APPEND_COLUMNS if col not in frame.columns]
+        if missing:
+            return [], [(row, f"нет колонок {missing}") for row in records], set()
+        
+        if self._match_keys is None:
+            self._match_keys = set(zip(
+                self._df['DATE'].astype(str), self._df['HOMETEAM'].astype(str), self._df['AWAYTEAM'].astype(str)
+            ))
+        
+        accepted, rejected, keys = [], [], set()
+        for row in records:
+            reason = self._check_row(row)
+            if reason is None:
+                key = (row['DATE'], row['HOMETEAM'], row['AWAYTEAM'])
+                if key in self._match_keys or key in keys:
+                    reason = "матч уже есть в данных"
+                else:
+                    keys.add(key)
+            
+            if reason is None:
+                accepted.append(row)
+            else:
+                rejected.append((row, reason))
+        return accepted, rejected, keys
+    
+    @staticmethod
+    def _check_row(row):
+        """Нормализует строку на месте; возвращает причину отказа или None"""
+        try:
+            if isinstance(row['DATE'], datetime.date):
+                date = pd.Timestamp(row['DATE'])
+            else:
+                date = pd.to_datetime(str(row['DATE']).strip(), format='%m/%d/%Y')
+        except (ValueError, TypeError):
+            return f"некорректная дата {row['DATE']!r}"
+        # Формат CSV: месяц/день/год без ведущих нулей
+        row['DATE'] = f"{date.month}/{date.day}/{date.year}"
+        row['DAY'], row['MONTH'], row['YEAR'] = date.day, date.month, date.year
+        
+        season = str(row['SEASON']).strip()
+        if not re.match(r'^\d{4}$', season):
+            return f"некорректный сезон {row['SEASON']!r}"
+        row['SEASON'] = season
+        
+        home, away = (str(row[col]).strip() for col in ('HOMETEAM', 'AWAYTEAM'))
+        if not home or not away or {home.lower(), away.lower()} & {'nan', 'none'}:
+            return "не указана команда"
+        if home == away:
+            return "команда играет сама с собой"
+        row['HOMETEAM'], row['AWAYTEAM'] = home, away
+        
+        hg, ag = pd.to_numeric(pd.Series([row['HG'], row['AG']]), errors='coerce')
+        if pd.isna(hg) or pd.isna(ag) or hg < 0 or ag < 0:
+            return f"некорректный счёт {row['HG']!r}:{row['AG']!r}"
+        row['HG'], row['AG'] = float(hg), float(ag)
+        
+        winner = row.get('WINNER')
+        winner = '' if winner is None or pd.isna(winner) else str(winner).strip()
+        if not winner:
+            if hg == ag:
+                return "ничья без указания победителя"
+            winner = home if hg > ag else away
+        if winner not in (home, away):
+            return f"победитель {winner!r} не участвовал в матче"
+        if (winner == home and hg < ag) or (winner == away and ag < hg):
+            return "победитель не совпадает со счётом"
+        row['WINNER'] = winner
+        return None
+    
+    @staticmethod
+    def _concat(df, new_rows, teams):
+        """Фрейм с дописанными строками; типы колонок — как у исходного фрейма"""
+        if len(teams) > df['HOMETEAM'].cat.categories.size:
+            # Новые команды — в конец словаря: коды прежних не меняются
+            df = df.assign(**{
+                col: df[col].cat.set_categories(teams)
+                for col in ('HOMETEAM', 'AWAYTEAM', 'WINNER') if col in df.columns
+            })
+        
+        new_rows = new_rows.reindex(columns=df.columns)
+        for col in df.columns:
+            if new_rows[col].dtype != df[col].dtype:
+                try:
+                    new_rows[col] = new_rows[col].astype(df[col].dtype)
+                except (ValueError, TypeError):
+                    pass
+        first = int(df.index.max()) + 1 if len(df) else 0
+        new_rows.index = pd.RangeIndex(first, first + len(new_rows))
+        return pd.concat([df, new_rows])
+    
+    def _source_meta(self):
+        stat = os.stat(self.data_path)
+        return {
+            'snapshot_version': self.SNAPSHOT_VERSION,
+            'pandas': pd.__version__,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': file_sha256(self.data_path)
+        }
+    
+    def _snapshot_meta_path(self):
+        return os.path.splitext(self.snapshot_path)[0] + ".json"
+    
+    def _load_snapshot(self, source_meta):
+        meta_path = self._snapshot_meta_path()
+        if not (os.path.exists(meta_path) and os.path.exists(self.snapshot_path)):
+            return False
+        
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            
+            if any(meta.get(key) != source_meta[key] for key in source_meta):
+                logger.info("CSV изменился — снимок данных будет пересобран")
+                return False
+            
+            self._df = pd.read_pickle(self.snapshot_path)
         except Exception as e:
-            logger.error(f"❌ Ошибка загрузки: {e}", exc_info=True)
+            logger.warning(f"Не удалось прочитать снимок данных: {e}")
             return False
+        
+        self.raw_row_count = meta.get('raw_row_count', len(self._df))
+        self.team_codes = {team: code for code, team in enumerate(self._df['HOMETEAM'].cat.categories)}
+        logger.info(f"Загружен снимок очищенных данных: {self.snapshot_path}")
+        return True
+    
+    def _save_snapshot(self, source_meta):
+        meta = dict(source_meta, raw_row_count=self.raw_row_count)
+        
+        # Сначала данные, потом метаданные — по метаданным снимок считается готовым
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path) or ".", exist_ok=True)
+            for path, write in [
+                (self.snapshot_path, lambda tmp: self._df.to_pickle(tmp)),
+                (self._snapshot_meta_path(), lambda tmp: self._write_json(tmp, meta)),
+            ]:
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                write(tmp_path)
+                os.replace(tmp_path, path)
+            logger.info(f"Снимок очищенных данных сохранён: {self.snapshot_path}")
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить снимок данных: {e}")
+    
+    @staticmethod
+    def _write_json(path, data):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
     
     def _clean_data(self):
         """Очистка данных"""
         logger.info("🧹 Очистка данных...")
-        
+        self._df, teams = self._clean_frame(self._df)
+        self.team_codes = {team: code for code, team in enumerate(teams)}
+        logger.info(f"После очистки осталось строк: {len(self._df)}")
+    
+    def _clean_frame(self, df, teams=None):
+        """Очистка произвольного фрейма; teams — уже существующий словарь команд (для дописываемых матчей)"""
         # 1. Очищаем сезоны - оставляем только числовые значения 4-значных сезонов
-        if 'SEASON' in self.df.columns:
+        if 'SEASON' in df.columns:
             # Преобразуем к строке и убираем пробелы
-            self.df['SEASON'] = self.df['SEASON'].astype(str).str.strip()
+            df['SEASON'] = df['SEASON'].astype(str).str.strip()
             
             # Фильтруем только корректные сезоны (4 цифры или формат типа "2526")
             season_pattern = r'^\d{4}$'  # Только 4 цифры
-            valid_seasons = self.df['SEASON'].str.match(season_pattern)
+            valid_seasons = df['SEASON'].str.match(season_pattern)
             
             # Находим проблемные строки
-            invalid_rows = self.df[~valid_seasons]
+            invalid_rows = df[~valid_seasons]
             if len(invalid_rows) > 0:
                 logger.warning(f"Найдено {len(invalid_rows)} строк с некорректными сезонами:")
                 unique_invalid = invalid_rows['SEASON'].unique()[:10]  # Первые 10
                 logger.warning(f"  Некорректные значения: {list(unique_invalid)}")
                 
                 # Удаляем строки с некорректными сезонами
-                self.df = self.df[valid_seasons].copy()
+                df = df[valid_seasons].copy()
                 logger.info(f"  Удалено строк: {len(invalid_rows)}")
             
             # Преобразуем сезоны в числовой формат для сортировки
-            self.df['SEASON'] = self.df['SEASON'].astype(int)
+            df['SEASON'] = df['SEASON'].astype(np.int16)
         
-        # 2. Очищаем названия команд
+        # 2. Очищаем названия команд и кодируем их общим словарём
         for col in ['HOMETEAM', 'AWAYTEAM', 'WINNER']:
-            if col in self.df.columns:
-                self.df[col] = self.df[col].astype(str).str.strip()
+            if col in df.columns:
+                df[col] = df[col].astype(str).str.strip()
+        teams = self._encode_teams(df, teams)
         
         # 3. Преобразуем числовые колонки
         numeric_columns = ['HG', 'AG', 'DAY', 'MONTH', 'YEAR']
         for col in numeric_columns:
-            if col in self.df.columns:
+            if col in df.columns:
                 # Заменяем пустые строки на NaN и преобразуем
-                self.df[col] = pd.to_numeric(self.df[col], errors='coerce')
+                df[col] = pd.to_numeric(df[col], errors='coerce')
         
-        logger.info(f"После очистки осталось строк: {len(self.df)}")
+        # 4. Исходы матчей и очки — один раз, векторно
+        self._add_outcome_columns(df)
+        return df, teams
+    
+    @staticmethod
+    def _encode_teams(df, teams=None):
+        """HOMETEAM/AWAYTEAM/WINNER -> Categorical с общим словарём и int16-коды HOME_ID/AWAY_ID/WINNER_ID.
+        
+        Новые команды добавляются в конец словаря teams — коды прежних команд не меняются.
+        """
+        names = pd.concat([df['HOMETEAM'], df['AWAYTEAM']]).dropna().unique()
+        names = sorted(team for team in names if team and team.lower() != 'nan')
+        if teams is None:
+            teams = names
+        else:
+            known = set(teams)
+            teams = list(teams) + [team for team in names if team not in known]
+        
+        for col, code_col in [('HOMETEAM', 'HOME_ID'), ('AWAYTEAM', 'AWAY_ID'), ('WINNER', 'WINNER_ID')]:
+            if col in df.columns:
+                df[col] = pd.Categorical(df[col], categories=teams)
+                # -1 — команда не из словаря (пустой или неизвестный победитель)
+                df[code_col] = df[col].cat.codes.astype(np.int16)
+        return teams
+    
+    @staticmethod
+    def _add_outcome_columns(df):
+        """HOME_WIN, IS_OT, IS_SO, WINNER_CODE, HOME_POINTS, AWAY_POINTS"""
+        add = df['ADD'].astype(str).str.strip().str.upper() if 'ADD' in df.columns else pd.Series('', index=df.index)
+        
+        winner_id = df['WINNER_ID'].to_numpy()
+        home_win = (winner_id >= 0) & (winner_id == df['HOME_ID'].to_numpy())
+        away_win = (winner_id >= 0) & (winner_id == df['AWAY_ID'].to_numpy())
+        is_ot = (add == 'AOT').to_numpy()
+        is_so = (add == 'PEN').to_numpy()
+        extra_time = is_ot | is_so
+        
+        df['HOME_WIN'] = home_win
+        df['IS_OT'] = is_ot
+        df['IS_SO'] = is_so
+        # 1 — победа хозяев, 0 — победа гостей, 2 — победитель не определён
+        df['WINNER_CODE'] = np.select([home_win, away_win], [1, 0], default=2).astype(np.int8)
+        
+        # 3 очка за победу в основное время, 2 за победу в ОТ/буллитах, 1 за поражение в ОТ/буллитах
+        df['HOME_POINTS'] = np.where(home_win, np.where(extra_time, 2, 3), np.where(extra_time & away_win, 1, 0)).astype(np.int8)
+        df['AWAY_POINTS'] = np.where(away_win, np.where(extra_time, 2, 3), np.where(extra_time & home_win, 1, 0)).astype(np.int8)
+    
+    @staticmethod
+    def _add_score(df):
+        df['SCORE'] = df['HG'].astype(str).str.strip() + ':' + df['AG'].astype(str).str.strip()
     
     def _get_metadata(self):
         try:
-            # Получаем уникальные команды
-            home_teams = self.df['HOMETEAM'].unique()
-            away_teams = self.df['AWAYTEAM'].unique()
-
-            all_teams_set = set(home_teams) | set(away_teams)
-            self.teams = sorted([team for team in all_teams_set if isinstance(team, str) and team.strip()])
+            # Команды — общий словарь кодов (уже отсортирован)
+            self._teams = list(self.team_codes)
             
-            logger.info(f"Найдено команд: {len(self.teams)}")
-            logger.info(f"Примеры команд (первые 10): {self.teams[:10]}")
+            logger.info(f"Найдено команд: {len(self._teams)}")
+            logger.info(f"Примеры команд (первые 10): {self._teams[:10]}")
 
             # Получаем уникальные сезоны
-            self.seasons = sorted(self.df['SEASON'].unique())
-            logger.info(f"Найдено сезонов: {len(self.seasons)}")
-            logger.info(f"Сезоны: {self.seasons}")
+            self._seasons = sorted(int(s) for s in self._df['SEASON'].unique())
+            logger.info(f"Найдено сезонов: {len(self._seasons)}")
+            logger.info(f"Сезоны: {self._seasons}")
             
         except Exception as e:
             logger.error(f"Ошибка получения метаданных: {e}", exc_info=True)
@@ -134,18 +704,18 @@ class DataLoader:
             return {}
         
         try:
-            # Ищем команду (с учетом возможных различий в написании)
-            team_name_clean = str(team_name).strip()
-            games = self.df[
-                (self.df['HOMETEAM'].str.strip() == team_name_clean) | 
-                (self.df['AWAYTEAM'].str.strip() == team_name_clean)
-            ]
+            code = self.get_team_code(team_name)
+            if code is None:
+                logger.warning(f"Не найдено игр для команды: {team_name}")
+                return {}
+            
+            games = self.df.iloc[self.index.team(self.teams[code])]
             
             if len(games) == 0:
                 logger.warning(f"Не найдено игр для команды: {team_name}")
                 return {}
             
-            wins = len(games[games['WINNER'].str.strip() == team_name_clean])
+            wins = int((games['WINNER_ID'] == code).sum())
             total = len(games)
             
             stats = {
@@ -163,6 +733,10 @@ class DataLoader:
             logger.error(f"Ошибка получения статистики: {e}", exc_info=True)
             return {}
     
+    def get_team_code(self, team_name):
+        """Код команды в общем словаре или None"""
+        return self.team_codes.get(str(team_name).strip())
+    
     def get_season_games(self, season):
         """Получить игры определенного сезона"""
         if self.df is None:
@@ -193,27 +767,16 @@ class DataLoader:
             return pd.DataFrame()
         
         try:
-            team_name_clean = str(team_name).strip()
-            mask = (self.df['HOMETEAM'].str.strip() == team_name_clean) | (self.df['AWAYTEAM'].str.strip() == team_name_clean)
-            
-            if season:
-                mask = mask & (self.df['SEASON'] == int(season))
+            code = self.get_team_code(team_name)
+            if code is None:
+                return self.df.iloc[0:0]
             
-            games = self.df[mask]
-            return games
+            return self.df.iloc[self.index.team(self.teams[code], season or None)]
             
         except Exception as e:
             logger.error(f"Ошибка получения игр: {e}")
             return pd.DataFrame()
 
+# Данные загружаются лениво: при первом обращении к loader.df / loader.teams / ...
+# или явным вызовом loader.init()
 loader = DataLoader("data/KHL_v1.csv")
-
-# Пытаемся загрузить данные при импорте
-try:
-    success = loader.load()
-    if success:
-        print("✅ Данные успешно загружены при импорте")
-    else:
-        print("❌ Не удалось загрузить данные при импорте")
-except Exception as e:
-    print(f"⚠️ Ошибка при загрузке данных: {e}")
\ No newline at end of file
@@ -0,0 +1,137 @@
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Общее число рабочих потоков и лимиты одновременных задач по категориям
+MAX_WORKERS = int(os.getenv("KHL_EXECUTOR_WORKERS", str(min(8, (os.cpu_count() or 1) + 4))))
+CATEGORY_LIMITS = {
+    "stats": int(os.getenv("KHL_EXECUTOR_STATS_LIMIT", "4")),
+    "predict": int(os.getenv("KHL_EXECUTOR_PREDICT_LIMIT", "2")),
+    # Графики рисуются через Figure без pyplot; рендер тяжёлый по CPU — держим лимит низким
+    "plot": int(os.getenv("KHL_EXECUTOR_PLOT_LIMIT", "2")),
+    # Фоновый прогрев кэша не должен вытеснять запросы пользователей
+    "warmup": int(os.getenv("KHL_EXECUTOR_WARMUP_LIMIT", "2")),
+    # Дописывание новых матчей — строго по одному
+    "ingest": 1,
+}
+DEFAULT_LIMIT = 2
+
+
+class Executor:
+    """Выполняет блокирующие вызовы в пуле потоков, не занимая цикл событий бота.
+
+    Потоки, а не процессы: numpy/sklearn отпускают GIL, а калькулятор и модель
+    общие и не сериализуются в каждый вызов.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, limits: Optional[Dict[str, int]] = None):
+        self.max_workers = max_workers
+        self.limits = dict(CATEGORY_LIMITS if limits is None else limits)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._metrics: Dict[str, Dict] = {}
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="khl-worker")
+        return self._pool
+
+    def _category(self, category: str):
+        if category not in self._semaphores:
+            self._semaphores[category] = asyncio.Semaphore(self.limits.get(category, DEFAULT_LIMIT))
+            self._metrics[category] = {
+                "queued": 0, "running": 0, "max_queued": 0,
+                "completed": 0, "failed": 0,
+                "wait_ms": 0.0, "run_ms": 0.0
+            }
+        return self._semaphores[category], self._metrics[category]
+
+    async def run(self, category: str, func: Callable, *args, **kwargs):
+        """Выполнить func(*args, **kwargs) в пуле с учётом лимита категории"""
+        semaphore, metrics = self._category(category)
+
+        queued_at = time.perf_counter()
+        if semaphore.locked():
+            # Лимит категории исчерпан — задача встаёт в очередь
+            metrics["queued"] += 1
+            metrics["max_queued"] = max(metrics["max_queued"], metrics["queued"])
+            try:
+                await semaphore.acquire()
+            finally:
+                metrics["queued"] -= 1
+        else:
+            await semaphore.acquire()
+
+        started_at = time.perf_counter()
+        metrics["wait_ms"] += (started_at - queued_at) * 1000
+        metrics["running"] += 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._get_pool(), functools.partial(func, *args, **kwargs)
+            )
+        except BaseException:
+            metrics["running"] -= 1
+            metrics["failed"] += 1
+            semaphore.release()
+            raise
+        
+        # Слот категории освобождается, когда поток действительно закончил, а не когда
+        # ожидающую корутину отменили: поток при отмене продолжает работать
+        future.add_done_callback(functools.partial(self._finish, semaphore, metrics, started_at))
+        return await asyncio.shield(future)
+    
+    @staticmethod
+    def _finish(semaphore: asyncio.Semaphore, metrics: Dict, started_at: float, future: asyncio.Future):
+        # Ошибку забираем здесь: если ожидавшего отменили, её больше никто не прочитает
+        if future.cancelled() or future.exception() is not None:
+            metrics["failed"] += 1
+        else:
+            metrics["completed"] += 1
+        metrics["running"] -= 1
+        metrics["run_ms"] += (time.perf_counter() - started_at) * 1000
+        semaphore.release()
+
+    def get_stats(self) -> Dict:
+        categories = {}
+        for category, metrics in self._metrics.items():
+            done = metrics["completed"] + metrics["failed"]
+            categories[category] = {
+                "limit": self.limits.get(category, DEFAULT_LIMIT),
+                "queued": metrics["queued"],
+                "running": metrics["running"],
+                "max_queued": metrics["max_queued"],
+                "completed": metrics["completed"],
+                "failed": metrics["failed"],
+                "avg_wait_ms": round(metrics["wait_ms"] / done, 1) if done else 0.0,
+                "avg_run_ms": round(metrics["run_ms"] / done, 1) if done else 0.0
+            }
+
+        return {
+            "max_workers": self.max_workers,
+            "categories": categories
+        }
+
+    def shutdown(self, wait: bool = True):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait)
+                self._pool = None
+        logger.info("Пул рабочих потоков остановлен")
+
+
+executor = Executor()
+
+
+async def run_blocking(category: str, func: Callable, *args, **kwargs):
+    """Сокращение для executor.run"""
+    return await executor.run(category, func, *args, **kwargs)
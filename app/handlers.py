@@ -1,6 +1,8 @@
+import time
 from aiogram import Router, F
 from aiogram.filters import Command, CommandStart
 from aiogram.types import Message, CallbackQuery, BufferedInputFile
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from app.prediction_formatter import PredictionFormatter
@@ -8,6 +10,7 @@ from app.prediction_formatter import PredictionFormatter
 from app.formatters import StatsFormatter
 from app.text_tables import TextTableFormatter
 from app.data_loader import loader
+from app.executor import run_blocking
 from data.team_names import TEAM_NAMES
 from app.keyboards import (
     get_main_menu, get_back_button, 
@@ -19,6 +22,9 @@ from app.keyboards import (
     get_ai_keyboard
 )
 
+# Минимальный интервал между правками сообщения при стриминге ответа ИИ, с
+STREAM_EDIT_INTERVAL = 1.0
+
 prediction_engine = None
 calculator = None
 plot_generator = None
@@ -229,7 +235,7 @@ async def show_general_stats(callback: CallbackQuery, state: FSMContext):
     team_id = data.get('selected_team')
     season_id = data.get('selected_season')
     
-    stats = calculator.get_team_stats(team_id, season_id)
+    stats = await run_blocking("stats", calculator.get_team_stats, team_id, season_id)
     
     if season_id == "all":
         season_name = "Все сезоны"
@@ -268,7 +274,7 @@ async def process_h2h_selection(callback: CallbackQuery, state: FSMContext):
             await callback.answer("❌ Выберите другую команду для сравнения!", show_alert=True)
             return
         
-        h2h_stats = calculator.get_head_to_head(team1_id, team2_id, season_id)
+        h2h_stats = await run_blocking("stats", calculator.get_head_to_head, team1_id, team2_id, season_id)
         
         if season_id == "all":
             season_name = "Все сезоны"
@@ -297,7 +303,7 @@ async def show_home_stats(callback: CallbackQuery, state: FSMContext):
     team_id = data.get('selected_team')
     season_id = data.get('selected_season')
     
-    stats = calculator.get_home_stats(team_id, season_id)
+    stats = await run_blocking("stats", calculator.get_home_stats, team_id, season_id)
     
     if season_id == "all":
         season_name = "Все сезоны"
@@ -338,7 +344,7 @@ async def show_away_stats(callback: CallbackQuery, state: FSMContext):
     team_id = data.get('selected_team')
     season_id = data.get('selected_season')
     
-    stats = calculator.get_away_stats(team_id, season_id)
+    stats = await run_blocking("stats", calculator.get_away_stats, team_id, season_id)
     
     if season_id == "all":
         season_name = "Все сезоны"
@@ -378,7 +384,7 @@ async def show_form_stats(callback: CallbackQuery, state: FSMContext):
     data = await state.get_data()
     team_id = data.get('selected_team')
     
-    form_stats = calculator.get_form_stats(team_id, n_games=10)
+    form_stats = await run_blocking("stats", calculator.get_form_stats, team_id, n_games=10)
     
     if not form_stats:
         response = f"❌ Нет данных о последних играх команды *{TEAM_NAMES.get(team_id, team_id)}*"
@@ -412,7 +418,7 @@ async def show_goals_stats(callback: CallbackQuery, state: FSMContext):
     team_id = data.get('selected_team')
     season_id = data.get('selected_season')
     
-    stats = calculator.get_team_stats(team_id, season_id)
+    stats = await run_blocking("stats", calculator.get_team_stats, team_id, season_id)
     
     if season_id == "all":
         season_name = "Все сезоны"
@@ -483,7 +489,7 @@ async def show_season_table(callback: CallbackQuery):
         else:
             season_name = f"20{season_id[:2]}/{season_id[2:]}"
         
-        table_data = calculator.get_season_table(season_id)
+        table_data = await run_blocking("stats", calculator.get_season_table, season_id)
         response = TextTableFormatter.format_season_table(table_data, season_name)
         
         await callback.message.edit_text(
@@ -525,7 +531,7 @@ async def show_top_winners(callback: CallbackQuery, state: FSMContext):
     else:
         season_name = f"20{season_id[:2]}/{season_id[2:]}"
     
-    top_data = calculator.get_top_winners(season_id, limit=10)
+    top_data = await run_blocking("stats", calculator.get_top_winners, season_id, limit=10)
     response = TextTableFormatter.format_top_winners(top_data, season_name)
     
     await callback.message.edit_text(
@@ -547,7 +553,7 @@ async def show_top_points(callback: CallbackQuery, state: FSMContext):
     else:
         season_name = f"20{season_id[:2]}/{season_id[2:]}"
     
-    top_data = calculator.get_top_points(season_id, limit=10)
+    top_data = await run_blocking("stats", calculator.get_top_points, season_id, limit=10)
     response = TextTableFormatter.format_top_points(top_data, season_name)
     
     await callback.message.edit_text(
@@ -569,7 +575,7 @@ async def show_top_winrate(callback: CallbackQuery, state: FSMContext):
     else:
         season_name = f"20{season_id[:2]}/{season_id[2:]}"
     
-    top_data = calculator.get_top_winrate(season_id, limit=10)
+    top_data = await run_blocking("stats", calculator.get_top_winrate, season_id, limit=10)
     response = TextTableFormatter.format_top_winrate(top_data, season_name)
     
     await callback.message.edit_text(
@@ -591,7 +597,7 @@ async def show_top_scorers(callback: CallbackQuery, state: FSMContext):
     else:
         season_name = f"20{season_id[:2]}/{season_id[2:]}"
     
-    top_data = calculator.get_top_goal_scorers(season_id, limit=10)
+    top_data = await run_blocking("stats", calculator.get_top_goal_scorers, season_id, limit=10)
     response = TextTableFormatter.format_top_scorers(top_data, season_name)
     
     await callback.message.edit_text(
@@ -614,7 +620,7 @@ async def show_full_table(callback: CallbackQuery, state: FSMContext):
         season_name = f"200{season_id[0]}/20{season_id[1:]}"
     else:
         season_name = f"20{season_id[:2]}/{season_id[2:]}"
-    table_data = calculator.get_season_table(season_id)
+    table_data = await run_blocking("stats", calculator.get_season_table, season_id)
     response = TextTableFormatter.format_season_table(table_data, season_name)
     
     await callback.message.edit_text(
@@ -703,6 +709,32 @@ async def plot_goals_compare_start(callback: CallbackQuery, state: FSMContext):
     )
     await callback.answer()
 
+async def send_plot(callback: CallbackQuery, caption: str, filename: str, chart_type: str, *args) -> bool:
+    """Отправить график: повторно — по file_id Telegram, иначе PNG из кэша или отрисованный в пуле"""
+    key = plot_generator.plot_key(chart_type, *args)
+    version = plot_generator.calculator.data_version
+    file_id = plot_generator.get_file_id(key)
+    
+    if file_id is not None:
+        photo = file_id
+    else:
+        png = await run_blocking("plot", plot_generator.render, chart_type, *args)
+        if png is None:
+            return False
+        photo = BufferedInputFile(png, filename=filename)
+    
+    await callback.message.delete()
+    sent = await callback.message.answer_photo(
+        photo=photo,
+        caption=caption,
+        parse_mode="Markdown",
+        reply_markup=get_back_only_keyboard()
+    )
+    
+    if file_id is None and sent.photo:
+        plot_generator.remember_file_id(key, sent.photo[-1].file_id, plot_generator.plot_tags(*args), version)
+    return True
+
 @router.callback_query(F.data.startswith("plot_season_"))
 async def plot_season_selected(callback: CallbackQuery, state: FSMContext):
     try:
@@ -716,13 +748,13 @@ async def plot_season_selected(callback: CallbackQuery, state: FSMContext):
         )
         
         if plot_type == "winners":
-            plot_buffer = plot_generator.create_top_winners_plot(season_id)
+            chart_type = "top_winners"
             caption = f"📊 Топ-10 команд по победам"
         elif plot_type == "points":
-            plot_buffer = plot_generator.create_top_points_plot(season_id)
+            chart_type = "top_points"
             caption = f"🏆 Топ-10 команд по очкам"
         elif plot_type == "goals":
-            plot_buffer = plot_generator.create_season_goals_plot(season_id)
+            chart_type = "season_goals"
             caption = f"🥅 Топ-10 команд по голам"
         else:
             await callback.answer("❌ Неизвестный тип графика", show_alert=True)
@@ -737,15 +769,11 @@ async def plot_season_selected(callback: CallbackQuery, state: FSMContext):
         
         caption += f"\n📅 Сезон: {season_name}"
         
-        photo = BufferedInputFile(plot_buffer.read(), filename="plot.png")
-        
-        await callback.message.delete()
-        await callback.message.answer_photo(
-            photo=photo,
-            caption=caption,
-            parse_mode="Markdown",
-            reply_markup=get_back_only_keyboard()
-        )
+        if not await send_plot(callback, caption, "plot.png", chart_type, season_id):
+            await callback.message.edit_text(
+                "❌ Нет данных для этого сезона",
+                reply_markup=get_back_only_keyboard()
+            )
         
     except Exception as e:
         await callback.answer(f"❌ Ошибка: {str(e)}", show_alert=True)
@@ -762,21 +790,9 @@ async def plot_team_selected(callback: CallbackQuery, state: FSMContext):
             parse_mode="Markdown"
         )
         
-        plot_buffer = plot_generator.create_team_form_plot(team_id, n_games=10)
+        caption = f"📈 Форма команды {team_id}\nПоследние 10 игр"
         
-        if plot_buffer:
-            caption = f"📈 Форма команды {team_id}\nПоследние 10 игр"
-            
-            photo = BufferedInputFile(plot_buffer.read(), filename="form_plot.png")
-            
-            await callback.message.delete()
-            await callback.message.answer_photo(
-                photo=photo,
-                caption=caption,
-                parse_mode="Markdown",
-                reply_markup=get_back_only_keyboard()
-            )
-        else:
+        if not await send_plot(callback, caption, "form_plot.png", "team_form", team_id, 10):
             await callback.message.edit_text(
                 f"❌ Нет данных для команды {team_id}",
                 parse_mode="Markdown",
@@ -817,8 +833,6 @@ async def plot_compare2_selected(callback: CallbackQuery, state: FSMContext):
             parse_mode="Markdown"
         )
         
-        plot_buffer = plot_generator.create_goals_comparison_plot(team1_id, team2_id, season_id)
-        
         if season_id == "all":
             season_name = "Все сезоны"
         elif len(season_id) == 3:
@@ -828,15 +842,11 @@ async def plot_compare2_selected(callback: CallbackQuery, state: FSMContext):
         
         caption = f"⚔️ Сравнение голов\n{team1_id} vs {team2_id}\n📅 Сезон: {season_name}"
         
-        photo = BufferedInputFile(plot_buffer.read(), filename="comparison_plot.png")
-        
-        await callback.message.delete()
-        await callback.message.answer_photo(
-            photo=photo,
-            caption=caption,
-            parse_mode="Markdown",
-            reply_markup=get_back_only_keyboard()
-        )
+        if not await send_plot(callback, caption, "comparison_plot.png", "goals_comparison", team1_id, team2_id, season_id):
+            await callback.message.edit_text(
+                "❌ Нет данных для сравнения",
+                reply_markup=get_back_only_keyboard()
+            )
         
     except Exception as e:
         await callback.answer(f"❌ Ошибка: {str(e)}", show_alert=True)
@@ -924,9 +934,9 @@ async def prediction_team2_selected(callback: CallbackQuery, state: FSMContext):
             parse_mode="Markdown"
         )
         
-        prediction = prediction_engine.predict_match(team1_id, team2_id)
+        prediction = await run_blocking("predict", prediction_engine.predict_match, team1_id, team2_id)
 
-        h2h_stats = prediction_engine.get_head_to_head_stats(team1_id, team2_id)
+        h2h_stats = await run_blocking("predict", prediction_engine.get_head_to_head_stats, team1_id, team2_id)
 
         prediction_text = PredictionFormatter.format_prediction(prediction)
         h2h_text = PredictionFormatter.format_head_to_head(h2h_stats, team1_id, team2_id)
@@ -1048,6 +1058,7 @@ async def process_ai_question(message: Message):
     """Обработка вопроса к ИИ"""
     user_text = message.text.strip()
     await message.bot.send_chat_action(message.chat.id, "typing")
+    status_message = None
     
     try:
         if ai_open_bot is None:
@@ -1059,10 +1070,28 @@ async def process_ai_question(message: Message):
             )
             return
         
-        response = ai_open_bot.ask(user_text)
+        # Ответ стримится: сообщение-заготовка дописывается по мере поступления текста
+        status_message = await message.answer("🤔 Думаю над ответом...")
+        last_edit = 0.0
         
+        async def on_delta(text: str):
+            nonlocal last_edit
+            now = time.monotonic()
+            # Telegram ограничивает частоту правок — не чаще раза в STREAM_EDIT_INTERVAL
+            if now - last_edit < STREAM_EDIT_INTERVAL or len(text) > 4000:
+                return
+            last_edit = now
+            try:
+                await status_message.edit_text(f"📊 Ответ ИИ:\n\n{text} ▌")
+            except TelegramBadRequest:
+                pass
+        
+        response = await ai_open_bot.aask(user_text, on_delta=on_delta)
+        if not response:
+            raise RuntimeError("Пустой ответ ИИ")
 
         if len(response) > 4000:
+            await status_message.delete()
             parts = [response[i:i+4000] for i in range(0, len(response), 4000)]
             for i, part in enumerate(parts):
                 if i == len(parts) - 1:
@@ -1077,14 +1106,26 @@ async def process_ai_question(message: Message):
                         parse_mode="Markdown"
                     )
         else:
-            await message.answer(
-                f"📊 *Ответ ИИ:*\n\n{response}",
-                parse_mode="Markdown",
-                reply_markup=get_ai_keyboard()
-            )
+            try:
+                await status_message.edit_text(
+                    f"📊 *Ответ ИИ:*\n\n{response}",
+                    parse_mode="Markdown",
+                    reply_markup=get_ai_keyboard()
+                )
+            except TelegramBadRequest:
+                # Незакрытая разметка в ответе модели — показываем как обычный текст
+                await status_message.edit_text(
+                    f"📊 Ответ ИИ:\n\n{response}",
+                    reply_markup=get_ai_keyboard()
+                )
             
     except Exception as e:
         print(f"Ошибка в ИИ: {e}")
+        if status_message is not None:
+            try:
+                await status_message.delete()
+            except TelegramBadRequest:
+                pass
         await message.answer(
             "❌ *Произошла ошибка при обработке запроса*\n\n"
             "Попробуйте:\n"
@@ -0,0 +1,48 @@
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Optional
+
+
+class LazyFacts(Mapping):
+    """Набор фактов для одного запроса: каждый факт вычисляется при первом чтении и запоминается.
+
+    Ведёт себя как словарь только для чтения (info["h2h_stats"], .get(...)),
+    но не считает то, что выбранный путь ответа так и не прочитал.
+    """
+
+    def __init__(self, values: Optional[Dict[str, Any]] = None):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._values: Dict[str, Any] = dict(values or {})
+
+    def add(self, key: str, factory: Callable[[], Any]):
+        self._factories[key] = factory
+        self._values.pop(key, None)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self._values:
+            if key not in self._factories:
+                raise KeyError(key)
+            self._values[key] = self._factories[key]()
+        return self._values[key]
+
+    def __contains__(self, key) -> bool:
+        # Без вычисления факта
+        return key in self._values or key in self._factories
+
+    def __iter__(self):
+        yield from self._values
+        for key in self._factories:
+            if key not in self._values:
+                yield key
+
+    def __len__(self) -> int:
+        return len(set(self._values) | set(self._factories))
+
+    def computed(self) -> list:
+        """Ключи уже вычисленных фактов (включая вложенные наборы)"""
+        keys = []
+        for key, value in self._values.items():
+            if key in self._factories:
+                keys.append(key)
+            if isinstance(value, LazyFacts):
+                keys.extend(f"{key}.{sub_key}" for sub_key in value.computed())
+        return keys
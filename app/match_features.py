@@ -0,0 +1,215 @@
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Окно формы (последние N игр), сглаживание разницы шайб, предел дней отдыха
+FORM_GAMES = int(os.getenv("KHL_FEATURE_FORM_GAMES", "5"))
+GD_EWMA_ALPHA = float(os.getenv("KHL_FEATURE_GD_ALPHA", "0.3"))
+REST_DAYS_CAP = 30
+# Доля побед, пока игр ещё не было
+NEUTRAL_RATE = 0.5
+
+# Признаки команды на момент матча: для хозяев — с префиксом HOME_, для гостей — AWAY_.
+# VENUE_WIN_RATE — доля побед дома для хозяев и в гостях для гостей
+TEAM_FEATURES = ('SEASON_WIN_RATE', 'VENUE_WIN_RATE', 'FORM', 'GD_EWMA', 'REST_DAYS')
+PAIR_FEATURES = ('H2H_GAMES', 'H2H_HOME_WIN_RATE')
+COLUMNS = (
+    [f"HOME_{name}" for name in TEAM_FEATURES]
+    + [f"AWAY_{name}" for name in TEAM_FEATURES]
+    + list(PAIR_FEATURES)
+)
+
+
+def _rate(wins: np.ndarray, games: np.ndarray) -> np.ndarray:
+    return np.where(games > 0, wins / np.maximum(games, 1), NEUTRAL_RATE)
+
+
+def _prefix_sums(values: np.ndarray) -> np.ndarray:
+    """sums[k] — сумма values[:k] (без k-го элемента)"""
+    sums = np.zeros(len(values) + 1)
+    np.cumsum(values, out=sums[1:])
+    return sums
+
+
+def _group_starts(*keys: np.ndarray) -> np.ndarray:
+    """Для массива, отсортированного по keys, — индекс начала группы каждого элемента"""
+    positions = np.arange(len(keys[0]))
+    new_group = np.zeros(len(positions), dtype=bool)
+    if len(positions):
+        new_group[0] = True
+    for key in keys:
+        new_group[1:] |= key[1:] != key[:-1]
+    return np.maximum.accumulate(np.where(new_group, positions, 0))
+
+
+class MatchFeatures:
+    """Признаки матчей на момент игры — только по предыдущим матчам, без заглядывания в будущее.
+
+    Каждый матч разворачивается в две записи «команда — матч», записи один раз сортируются
+    по (команда, дата), а суммы с начала группы, не включающие текущую игру, дают состояние
+    команды перед матчем: доля побед в сезоне, дома/в гостях, форма за FORM_GAMES игр,
+    EWMA разницы шайб и дни отдыха. Личные встречи — так же по сортировке (пара, дата).
+    Кроме сортировки — векторные O(N) операции, без циклов по командам и матчам.
+
+    matrix — признаки в порядке строк фрейма (float32, колонки COLUMNS) для обучения;
+    team_* и h2h_* — состояние после последней игры для прогноза будущих матчей.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        build_start = time.time()
+        n_teams = len(df['HOMETEAM'].cat.categories)
+        n = len(df)
+
+        home = df['HOME_ID'].to_numpy(dtype=np.int64)
+        away = df['AWAY_ID'].to_numpy(dtype=np.int64)
+        winner_code = df['WINNER_CODE'].to_numpy()
+        hg = df['HG'].fillna(0).to_numpy(dtype=float)
+        ag = df['AG'].fillna(0).to_numpy(dtype=float)
+        seasons = df['SEASON'].to_numpy(dtype=np.int64)
+        # Дата — из DATE: в YEAR встречаются опечатки (2324 вместо 2024)
+        dates = pd.to_datetime(df['DATE'], format='%m/%d/%Y').to_numpy().astype('datetime64[D]').astype(np.int64)
+
+        self.matrix = np.full((n, len(COLUMNS)), NEUTRAL_RATE, dtype=np.float32)
+        self._team_pass(n_teams, home, away, winner_code, hg, ag, seasons, dates)
+        self._pair_pass(n_teams, home, away, winner_code, dates)
+
+        logger.info(f"Признаки {len(COLUMNS)} × {n} матчей построены за {(time.time() - build_start) * 1000:.0f} мс")
+
+    def _team_pass(self, n_teams, home, away, winner_code, hg, ag, seasons, dates):
+        n = len(home)
+        match = np.concatenate([np.arange(n), np.arange(n)])
+        team = np.concatenate([home, away])
+        is_home = np.concatenate([np.ones(n, dtype=bool), np.zeros(n, dtype=bool)])
+        win = np.concatenate([winner_code == 1, winner_code == 0]).astype(float)
+        goal_diff = np.concatenate([hg - ag, ag - hg])
+        season = np.concatenate([seasons, seasons])
+        date = np.concatenate([dates, dates])
+
+        valid = team >= 0
+        order = np.lexsort((match[valid], date[valid], team[valid]))
+        match, team, is_home, win, goal_diff, season, date = (
+            values[valid][order] for values in (match, team, is_home, win, goal_diff, season, date)
+        )
+
+        k = np.arange(len(team))
+        team_start = _group_starts(team)
+        form_start = np.maximum(team_start, k - FORM_GAMES)
+        first_game = k == team_start
+
+        wins = _prefix_sums(win)
+        home_games, home_wins = _prefix_sums(is_home), _prefix_sums(win * is_home)
+        away_games, away_wins = _prefix_sums(~is_home), _prefix_sums(win * ~is_home)
+
+        # Метки сезона в данных не всегда идут подряд по датам (например, 2222 внутри 2223),
+        # поэтому сезон-к-дате считается по отдельной сортировке (команда, сезон, дата)
+        by_season = np.lexsort((k, season, team))
+        season_start = _group_starts(team[by_season], season[by_season])
+        season_wins = _prefix_sums(win[by_season])
+        season_rate = np.empty(len(k))
+        season_rate[by_season] = _rate(season_wins[k] - season_wins[season_start], k - season_start)
+        venue_rate = np.where(
+            is_home,
+            _rate(home_wins[k] - home_wins[team_start], home_games[k] - home_games[team_start]),
+            _rate(away_wins[k] - away_wins[team_start], away_games[k] - away_games[team_start])
+        )
+        form = _rate(wins[k] - wins[form_start], k - form_start)
+
+        # EWMA включая текущую игру; для признака берём значение после предыдущей игры команды
+        ewma = pd.Series(goal_diff).groupby(team).ewm(alpha=GD_EWMA_ALPHA, adjust=False).mean().to_numpy()
+        gd_ewma = np.where(first_game, 0.0, np.concatenate([[0.0], ewma[:-1]]))
+
+        previous_date = np.concatenate([date[:1], date[:-1]])
+        rest_days = np.where(first_game, REST_DAYS_CAP, np.minimum(date - previous_date, REST_DAYS_CAP))
+
+        block = np.column_stack([season_rate, venue_rate, form, gd_ewma, rest_days])
+        width = len(TEAM_FEATURES)
+        self.matrix[match[is_home], :width] = block[is_home]
+        self.matrix[match[~is_home], width:2 * width] = block[~is_home]
+
+        # Состояние после последней игры каждой команды (включая её)
+        self.team_season_rate = np.full(n_teams, NEUTRAL_RATE)
+        self.team_home_rate = np.full(n_teams, NEUTRAL_RATE)
+        self.team_away_rate = np.full(n_teams, NEUTRAL_RATE)
+        self.team_form = np.full(n_teams, NEUTRAL_RATE)
+        self.team_gd_ewma = np.zeros(n_teams)
+        self.team_last_date = np.full(n_teams, np.iinfo(np.int64).min // 2)
+        self.reference_date = int(dates.max()) + 1 if n else 0
+        if not len(team):
+            return
+
+        last = np.flatnonzero(np.concatenate([team[1:] != team[:-1], [True]]))
+        after = last + 1
+        teams = team[last]
+        last_form_start = np.maximum(team_start[last], after - FORM_GAMES)
+
+        # Сезон-к-дате для будущих матчей — по последнему сезону в данных
+        latest = season[by_season] == season.max()
+        season_team = team[by_season][latest]
+        season_games = np.bincount(season_team, minlength=n_teams)
+        season_won = np.bincount(season_team, weights=win[by_season][latest], minlength=n_teams)
+        self.team_season_rate = _rate(season_won, season_games)
+        self.team_home_rate[teams] = _rate(home_wins[after] - home_wins[team_start[last]],
+                                           home_games[after] - home_games[team_start[last]])
+        self.team_away_rate[teams] = _rate(away_wins[after] - away_wins[team_start[last]],
+                                           away_games[after] - away_games[team_start[last]])
+        self.team_form[teams] = _rate(wins[after] - wins[last_form_start], after - last_form_start)
+        self.team_gd_ewma[teams] = ewma[last]
+        self.team_last_date[teams] = date[last]
+
+    def _pair_pass(self, n_teams, home, away, winner_code, dates):
+        valid = (home >= 0) & (away >= 0)
+        rows = np.flatnonzero(valid)
+        low = np.minimum(home, away)[valid]
+        high = np.maximum(home, away)[valid]
+        pair = low * n_teams + high
+        order = np.lexsort((rows, dates[valid], pair))
+
+        rows, pair = rows[order], pair[order]
+        low_is_home = home[rows] == low[order]
+        home_won, away_won = winner_code[rows] == 1, winner_code[rows] == 0
+        low_won = np.where(low_is_home, home_won, away_won)
+        high_won = np.where(low_is_home, away_won, home_won)
+
+        k = np.arange(len(rows))
+        pair_start = _group_starts(pair)
+        low_wins, high_wins = _prefix_sums(low_won), _prefix_sums(high_won)
+        games = k - pair_start
+        home_team_wins = np.where(
+            low_is_home,
+            low_wins[k] - low_wins[pair_start],
+            high_wins[k] - high_wins[pair_start]
+        )
+
+        offset = 2 * len(TEAM_FEATURES)
+        self.matrix[rows, offset] = games
+        self.matrix[rows, offset + 1] = _rate(home_team_wins, games)
+
+        # Для прогноза: всего встреч пары и победы команды-строки над командой-столбцом
+        self.h2h_games = np.zeros((n_teams, n_teams), dtype=np.int64)
+        self.h2h_wins = np.zeros((n_teams, n_teams), dtype=np.int64)
+        home_v, away_v, code_v = home[valid], away[valid], winner_code[valid]
+        np.add.at(self.h2h_games, (home_v, away_v), 1)
+        np.add.at(self.h2h_games, (away_v, home_v), 1)
+        np.add.at(self.h2h_wins, (home_v[code_v == 1], away_v[code_v == 1]), 1)
+        np.add.at(self.h2h_wins, (away_v[code_v == 0], home_v[code_v == 0]), 1)
+
+    def serving_matrix(self, home_pos: np.ndarray, away_pos: np.ndarray) -> np.ndarray:
+        """Признаки будущих матчей (хозяева, гости) — по состоянию после последних игр команд.
+
+        Дни отдыха считаются до дня, следующего за последним матчем в данных.
+        """
+        rest = np.minimum(self.reference_date - self.team_last_date, REST_DAYS_CAP)
+        games = self.h2h_games[home_pos, away_pos]
+
+        return np.column_stack([
+            self.team_season_rate[home_pos], self.team_home_rate[home_pos], self.team_form[home_pos],
+            self.team_gd_ewma[home_pos], rest[home_pos],
+            self.team_season_rate[away_pos], self.team_away_rate[away_pos], self.team_form[away_pos],
+            self.team_gd_ewma[away_pos], rest[away_pos],
+            games, _rate(self.h2h_wins[home_pos, away_pos], games)
+        ]).astype(np.float32)
@@ -0,0 +1,177 @@
+import io
+import logging
+import time
+from typing import Optional
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+
+from app.stats_calculator import StatsCalculator
+from app.simple_cache import make_cache_key, get_or_compute, get_from_cache, save_to_cache
+
+logger = logging.getLogger(__name__)
+
+WIN_COLOR = "#2e7d32"
+LOSS_COLOR = "#c62828"
+BAR_COLOR = "#1565c0"
+SECOND_COLOR = "#ef6c00"
+
+
+class PlotGenerator:
+    """Графики для бота.
+
+    Рисуем через объектный API matplotlib (Figure + Agg) без pyplot —
+    без глобального состояния, поэтому графики можно строить в пуле потоков.
+    Готовые PNG кэшируются по (поколение данных, тип, параметры), а после
+    первой отправки запоминается file_id Telegram, чтобы не загружать файл
+    повторно. Записи помечены тегами параметров (команды, сезон): при
+    дописывании матчей сбрасываются только графики затронутых команд и сезонов.
+    """
+
+    CHARTS = ('top_winners', 'top_points', 'season_goals', 'team_form', 'goals_comparison')
+
+    def __init__(self, calculator: StatsCalculator, dpi: int = 100):
+        self.calculator = calculator
+        self.dpi = dpi
+
+    def plot_key(self, chart_type: str, *args) -> str:
+        return make_cache_key("plot", self.calculator.cache_version, chart_type, *args)
+    
+    @staticmethod
+    def plot_tags(*args) -> set:
+        return {str(arg) for arg in args}
+
+    def render(self, chart_type: str, *args) -> Optional[bytes]:
+        """PNG графика (из кэша или отрисованный); None, если данных нет"""
+        if chart_type not in self.CHARTS:
+            raise ValueError(f"Неизвестный тип графика: {chart_type}")
+
+        draw = getattr(self, f"_draw_{chart_type}")
+        return get_or_compute(self.plot_key(chart_type, *args), lambda: self._render_png(draw, *args),
+                              tags=self.plot_tags(*args), version=self.calculator.data_version)
+
+    def get_file_id(self, key: str) -> Optional[str]:
+        return get_from_cache(make_cache_key("plot_file_id", key))
+
+    def remember_file_id(self, key: str, file_id: str, tags=None, version: Optional[int] = None):
+        save_to_cache(make_cache_key("plot_file_id", key), file_id, tags=tags, version=version)
+
+    # Совместимые обёртки: BytesIO, как ждут обработчики
+    def create_top_winners_plot(self, season_id: str = "all") -> Optional[io.BytesIO]:
+        return self._as_buffer(self.render("top_winners", season_id))
+
+    def create_top_points_plot(self, season_id: str = "all") -> Optional[io.BytesIO]:
+        return self._as_buffer(self.render("top_points", season_id))
+
+    def create_season_goals_plot(self, season_id: str = "all") -> Optional[io.BytesIO]:
+        return self._as_buffer(self.render("season_goals", season_id))
+
+    def create_team_form_plot(self, team_name: str, n_games: int = 10) -> Optional[io.BytesIO]:
+        return self._as_buffer(self.render("team_form", team_name, n_games))
+
+    def create_goals_comparison_plot(self, team1: str, team2: str, season_id: str = "all") -> Optional[io.BytesIO]:
+        return self._as_buffer(self.render("goals_comparison", team1, team2, season_id))
+
+    def _as_buffer(self, png: Optional[bytes]) -> Optional[io.BytesIO]:
+        return io.BytesIO(png) if png is not None else None
+
+    def _render_png(self, draw, *args) -> Optional[bytes]:
+        start = time.time()
+        fig = Figure(figsize=(10, 6), dpi=self.dpi)
+        if not draw(fig, *args):
+            return None
+
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png")
+        logger.info(f"График {draw.__name__[6:]} {args} построен за {(time.time() - start) * 1000:.0f} мс")
+        return buffer.getvalue()
+
+    def _season_title(self, season_id: str) -> str:
+        return "все сезоны" if season_id == "all" else f"сезон {season_id}"
+
+    def _draw_top_bar(self, fig: Figure, items: list, value_key: str, title: str, xlabel: str) -> bool:
+        if not items:
+            return False
+
+        teams = [item['team'] for item in items][::-1]
+        values = [item[value_key] for item in items][::-1]
+
+        ax = fig.add_subplot()
+        bars = ax.barh(teams, values, color=BAR_COLOR)
+        ax.bar_label(bars, padding=3)
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.margins(x=0.1)
+        return True
+
+    def _draw_top_winners(self, fig: Figure, season_id: str) -> bool:
+        items = self.calculator.get_top_winners(season_id, limit=10)
+        return self._draw_top_bar(fig, items, 'wins', f"Топ-10 по победам ({self._season_title(season_id)})", "Победы")
+
+    def _draw_top_points(self, fig: Figure, season_id: str) -> bool:
+        items = self.calculator.get_top_points(season_id, limit=10)
+        return self._draw_top_bar(fig, items, 'points', f"Топ-10 по очкам ({self._season_title(season_id)})", "Очки")
+
+    def _draw_season_goals(self, fig: Figure, season_id: str) -> bool:
+        items = self.calculator.get_top_goal_scorers(season_id, limit=10)
+        return self._draw_top_bar(fig, items, 'goals', f"Топ-10 по забитым голам ({self._season_title(season_id)})", "Голы")
+
+    def _draw_team_form(self, fig: Figure, team_name: str, n_games: int) -> bool:
+        games = self.calculator.get_last_games(team_name, n_games)
+        if not games:
+            return False
+
+        # Хронологический порядок: слева — самая ранняя игра
+        games = games[::-1]
+        labels, diffs, colors = [], [], []
+        for game in games:
+            home_goals, away_goals = (float(x) if x != 'nan' else 0.0 for x in game['score'].split(':'))
+            diff = home_goals - away_goals if game['is_home'] else away_goals - home_goals
+            opponent = game['away_team'] if game['is_home'] else game['home_team']
+
+            labels.append(f"{game['date']}\n{'vs' if game['is_home'] else '@'} {opponent}")
+            diffs.append(diff)
+            colors.append(WIN_COLOR if game['winner'] == team_name else LOSS_COLOR)
+
+        ax = fig.add_subplot()
+        ax.bar(range(len(diffs)), diffs, color=colors)
+        ax.axhline(0, color="black", linewidth=0.8)
+        ax.set_xticks(range(len(labels)), labels, rotation=45, ha="right", fontsize=8)
+        ax.set_ylabel("Разница шайб")
+        wins = sum(1 for color in colors if color == WIN_COLOR)
+        ax.set_title(f"Форма {team_name}: {wins} побед в {len(games)} играх")
+        return True
+
+    def _draw_goals_comparison(self, fig: Figure, team1: str, team2: str, season_id: str) -> bool:
+        season = None if season_id == "all" else season_id
+        rows = []
+        for team in (team1, team2):
+            total = self.calculator.get_team_stats(team, season)
+            home = self.calculator.get_home_stats(team, season)
+            away = self.calculator.get_away_stats(team, season)
+            rows.append([
+                total.get('goals_scored', 0),
+                total.get('goals_conceded', 0),
+                home.get('goals_scored', 0),
+                away.get('goals_scored', 0)
+            ])
+
+        if not any(sum(row) for row in rows):
+            return False
+
+        categories = ["Забито", "Пропущено", "Забито дома", "Забито в гостях"]
+        positions = range(len(categories))
+        width = 0.38
+
+        ax = fig.add_subplot()
+        bars1 = ax.bar([p - width / 2 for p in positions], rows[0], width, label=team1, color=BAR_COLOR)
+        bars2 = ax.bar([p + width / 2 for p in positions], rows[1], width, label=team2, color=SECOND_COLOR)
+        ax.bar_label(bars1, padding=2, fontsize=8)
+        ax.bar_label(bars2, padding=2, fontsize=8)
+        ax.set_xticks(list(positions), categories)
+        ax.set_ylabel("Голы")
+        ax.set_title(f"{team1} vs {team2} ({self._season_title(season_id)})")
+        ax.legend()
+        return True
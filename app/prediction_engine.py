@@ -1,137 +1,342 @@
 import pandas as pd
 import numpy as np
+import sklearn
 from sklearn.preprocessing import LabelEncoder
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
-from typing import Dict, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
+import copy
+import hashlib
+import json
 import logging
+import os
+import pickle
+import threading
+import time
+from app.data_loader import Dataset
+from app.match_features import MatchFeatures, COLUMNS as MATCH_FEATURE_COLUMNS
 
 logger = logging.getLogger(__name__)
 
+# Версия формата артефакта модели: при изменении признаков или схемы — увеличить
+ARTIFACT_VERSION = 4
+MODEL_DIR = os.getenv("KHL_MODEL_DIR", "models")
+
+# Дообучение на дописанных матчах: столько деревьев добавляется за одно обновление,
+# обучаются они на стольких последних матчах; после MAX_TREES деревьев — полное переобучение
+UPDATE_TREES = int(os.getenv("KHL_MODEL_UPDATE_TREES", "10"))
+UPDATE_WINDOW = int(os.getenv("KHL_MODEL_UPDATE_WINDOW", "2000"))
+MAX_TREES = int(os.getenv("KHL_MODEL_MAX_TREES", "200"))
+
+# n_jobs обученного леса: прогноз идёт по одной строке или одному туру, и запуск потоков joblib
+# дороже самих деревьев; n_jobs движка используется только при обучении
+PREDICT_N_JOBS = 1
+
 class PredictionEngine:
-    def __init__(self, df: pd.DataFrame):
-        self.df = df.copy()
+    # Коды команд + признаки на момент матча (форма, сезон-к-дате, отдых, личные встречи), см. MatchFeatures
+    FEATURE_COLUMNS = ['HOME_TEAM_ENCODED', 'AWAY_TEAM_ENCODED'] + MATCH_FEATURE_COLUMNS
+    
+    def __init__(self, dataset: Dataset, n_jobs: Optional[int] = None, model_dir: Optional[str] = MODEL_DIR,
+                 base: 'PredictionEngine' = None):
+        # Общий фрейм DataLoader — без копии
+        self.dataset = dataset
+        self.n_jobs = n_jobs
+        self.model_dir = model_dir
+        self.df = dataset.df
+        self.index = dataset.index
         self.model = None
         self.le = None
         self.team_stats = None
+        # Счётчики по кодам команд: [игры дома, игры в гостях, победы дома, победы в гостях]
+        self.team_counts = None
         self.feature_columns = None
-        self._prepare_data()
-        self._train_model()
+        self.accuracy = None
+        # Признаки всех матчей для обучения и состояние команд для прогноза — один проход по данным
+        self.features = MatchFeatures(self.df)
+        
+        if base is not None:
+            # Дообучение копии модели base на дописанных матчах (см. updated)
+            self._update_from(base)
+            self._save_artifact()
+        # Обучаем только если нет артефакта для этих же данных и признаков
+        elif not self._load_artifact():
+            self._prepare_data()
+            self._train_model()
+            self._save_artifact()
+        
+        self._build_proba_matrix()
     
-    def _prepare_data(self):
- 
-        df_preds = self.df[['HOMETEAM', 'AWAYTEAM', 'WINNER', 'HG', 'AG', 'ADD', 'SEASON']].copy()
+    def _artifact_key(self) -> Optional[str]:
+        if not self.model_dir or not self.dataset.fingerprint:
+            return None
+        
+        payload = json.dumps({
+            'data': self.dataset.fingerprint,
+            # team_counts и позиции команд — по int-кодам: порядок категорий зависит от истории снимка
+            'teams': list(self.df['HOMETEAM'].cat.categories),
+            'features': self.FEATURE_COLUMNS,
+            'artifact_version': ARTIFACT_VERSION,
+            'sklearn': sklearn.__version__
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _artifact_path(self) -> str:
+        return os.path.join(self.model_dir, f"prediction_engine_v{ARTIFACT_VERSION}.pkl")
+    
+    def _load_artifact(self) -> bool:
+        key = self._artifact_key()
+        if key is None or not os.path.exists(self._artifact_path()):
+            return False
+        
+        try:
+            with open(self._artifact_path(), 'rb') as f:
+                artifact = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать артефакт модели: {e}")
+            return False
+        
+        if artifact.get('key') != key:
+            logger.info("Данные или признаки изменились — модель будет переобучена")
+            return False
         
+        self.model = artifact['model']
+        self.model.set_params(n_jobs=PREDICT_N_JOBS)
+        self.le = artifact['le']
+        self.team_stats = artifact['team_stats']
+        self.team_counts = artifact['team_counts']
+        self.feature_columns = artifact['feature_columns']
+        self.accuracy = artifact.get('accuracy')
+        
+        logger.info(f"Модель загружена из {self._artifact_path()} (точность: {self.accuracy:.2%})")
+        return True
+    
+    def _save_artifact(self):
+        key = self._artifact_key()
+        if key is None:
+            return
+        
+        artifact = {
+            'key': key,
+            'model': self.model,
+            'le': self.le,
+            'team_stats': self.team_stats,
+            'team_counts': self.team_counts,
+            'feature_columns': self.feature_columns,
+            'accuracy': self.accuracy
+        }
+        
+        # Пишем во временный файл и атомарно подменяем — параллельные процессы не увидят половину файла
+        path = self._artifact_path()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.model_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            logger.info(f"Модель сохранена в {path}")
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить артефакт модели: {e}")
+    
+    def _prepare_data(self):
+        # Проценты побед за всю историю — только для показа в прогнозе, в признаки модели не входят
+        teams = list(self.df['HOMETEAM'].cat.categories)
+        self.team_counts = self._count_games(self.df, len(teams))
+        self.team_stats = self._team_stats_from_counts(self.team_counts, teams)
+
+        self.le = LabelEncoder()
+        all_teams = pd.concat([self.df['HOMETEAM'], self.df['AWAYTEAM']]).dropna().unique()
+        self.le.fit(all_teams.astype(str))
 
-        self.team_stats = {}
+        self.feature_columns = list(self.FEATURE_COLUMNS)
+    
+    @staticmethod
+    def _count_games(df: pd.DataFrame, n_teams: int) -> np.ndarray:
+        """Счётчики по int-кодам команд вместо фильтрации по названию для каждой команды"""
+        home_ids = df['HOME_ID'].to_numpy()
+        away_ids = df['AWAY_ID'].to_numpy()
+        winner_code = df['WINNER_CODE'].to_numpy()
         
-        for team in pd.concat([df_preds['HOMETEAM'], df_preds['AWAYTEAM']]).unique():
-            home_games = df_preds[df_preds['HOMETEAM'] == team]
-            away_games = df_preds[df_preds['AWAYTEAM'] == team]
-            
-            total_games = len(home_games) + len(away_games)
+        return np.vstack([
+            np.bincount(home_ids[home_ids >= 0], minlength=n_teams),
+            np.bincount(away_ids[away_ids >= 0], minlength=n_teams),
+            np.bincount(home_ids[(home_ids >= 0) & (winner_code == 1)], minlength=n_teams),
+            np.bincount(away_ids[(away_ids >= 0) & (winner_code == 0)], minlength=n_teams)
+        ])
+    
+    @staticmethod
+    def _team_stats_from_counts(counts: np.ndarray, teams: list) -> Dict:
+        home_games, away_games, home_wins, away_wins = counts
+        team_stats = {}
+        
+        for code, team in enumerate(teams):
+            total_games = int(home_games[code] + away_games[code])
             
             if total_games > 0:
-                home_win_rate = len(home_games[home_games['WINNER'] == team]) / len(home_games) if len(home_games) > 0 else 0
-                away_win_rate = len(away_games[away_games['WINNER'] == team]) / len(away_games) if len(away_games) > 0 else 0
-                overall_win_rate = (len(home_games[home_games['WINNER'] == team]) + len(away_games[away_games['WINNER'] == team])) / total_games
-                
-                self.team_stats[team] = {
-                    'home_win_rate': home_win_rate,
-                    'away_win_rate': away_win_rate,
-                    'overall_win_rate': overall_win_rate,
+                team_stats[team] = {
+                    'home_win_rate': float(home_wins[code] / home_games[code]) if home_games[code] > 0 else 0,
+                    'away_win_rate': float(away_wins[code] / away_games[code]) if away_games[code] > 0 else 0,
+                    'overall_win_rate': float(home_wins[code] + away_wins[code]) / total_games,
                     'total_games': total_games
                 }
             else:
-                self.team_stats[team] = {'home_win_rate': 0, 'away_win_rate': 0, 'overall_win_rate': 0, 'total_games': 0}
+                team_stats[team] = {'home_win_rate': 0, 'away_win_rate': 0, 'overall_win_rate': 0, 'total_games': 0}
+        return team_stats
+    
+    def _team_codes(self) -> np.ndarray:
+        """Код LabelEncoder по int-коду команды (позиции в категориях) — без transform по строкам"""
+        codes = {team: code for code, team in enumerate(self.le.classes_)}
+        return np.array([codes.get(team, -1) for team in self.df['HOMETEAM'].cat.categories], dtype=np.int64)
+    
+    def _training_matrix(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Матрица признаков (float32, колонки FEATURE_COLUMNS) для строк фрейма rows или всех строк"""
+        if rows is None:
+            rows = np.arange(len(self.df))
+        team_codes = self._team_codes()
         
-
-        df_preds['HOME_WIN_RATE'] = df_preds['HOMETEAM'].map(lambda x: self.team_stats[x]['home_win_rate'])
-        df_preds['AWAY_WIN_RATE'] = df_preds['AWAYTEAM'].map(lambda x: self.team_stats[x]['away_win_rate'])
-        df_preds['HOME_OVERALL_RATE'] = df_preds['HOMETEAM'].map(lambda x: self.team_stats[x]['overall_win_rate'])
-        df_preds['AWAY_OVERALL_RATE'] = df_preds['AWAYTEAM'].map(lambda x: self.team_stats[x]['overall_win_rate'])
+        X = np.empty((len(rows), len(self.FEATURE_COLUMNS)), dtype=np.float32)
+        X[:, 0] = team_codes[self.df['HOME_ID'].to_numpy()[rows]]
+        X[:, 1] = team_codes[self.df['AWAY_ID'].to_numpy()[rows]]
+        X[:, 2:] = self.features.matrix[rows]
+        return X
+    
+    def can_update(self, dataset: Dataset) -> bool:
+        """Можно ли дообучить модель на dataset, а не обучать заново"""
+        return (
+            dataset.generation == self.dataset.generation
+            and len(dataset) > len(self.dataset)
+            and self.team_counts is not None
+            # Новая команда меняет коды LabelEncoder — старые деревья к ним не готовы
+            and set(dataset.teams) <= set(self.le.classes_)
+            and len(self.model.estimators_) + UPDATE_TREES <= MAX_TREES
+        )
+    
+    def updated(self, dataset: Dataset) -> 'PredictionEngine':
+        """Модель для набора данных с дописанными матчами.
         
-
-        self.le = LabelEncoder()
-        all_teams = pd.concat([df_preds['HOMETEAM'], df_preds['AWAYTEAM']]).unique()
-        self.le.fit(all_teams)
+        Если можно — копия текущей модели с UPDATE_TREES новыми деревьями (warm_start),
+        обученными на последних матчах, и счётчиками команд, пересчитанными только по новым строкам;
+        иначе — полное обучение. Текущая модель не меняется: её продолжают использовать
+        запросы, пока новая не готова.
+        """
+        if self.can_update(dataset):
+            return PredictionEngine(dataset, n_jobs=self.n_jobs, model_dir=self.model_dir, base=self)
+        logger.info("Дообучение невозможно (новые команды, полная перезагрузка или предел деревьев) — обучаем заново")
+        return PredictionEngine(dataset, n_jobs=self.n_jobs, model_dir=self.model_dir)
+    
+    def _update_from(self, base: 'PredictionEngine'):
+        update_start = time.time()
+        start = len(base.df)
+        teams = list(self.df['HOMETEAM'].cat.categories)
         
-        df_preds['HOME_TEAM_ENCODED'] = self.le.transform(df_preds['HOMETEAM'])
-        df_preds['AWAY_TEAM_ENCODED'] = self.le.transform(df_preds['AWAYTEAM'])
+        self.le = base.le
+        self.feature_columns = base.feature_columns
+        self.team_counts = base.team_counts + self._count_games(self.df.iloc[start:], len(teams))
+        self.team_stats = self._team_stats_from_counts(self.team_counts, teams)
         
-
-        def get_winner_code(row):
-            if row['WINNER'] == row['HOMETEAM']:
-                return 1  
-            elif row['WINNER'] == row['AWAYTEAM']:
-                return 0
-            else:
-                return 2
+        rows = self._update_rows(base.model.classes_)
+        X = self._training_matrix(rows)
+        y = self.df['WINNER_CODE'].to_numpy()[rows]
         
-        df_preds['WINNER_CODE'] = df_preds.apply(get_winner_code, axis=1)
+        # Деревья base общие (только чтение), список и параметры — свои
+        self.model = copy.copy(base.model)
+        self.model.estimators_ = list(base.model.estimators_)
+        self.model.set_params(warm_start=True, n_estimators=len(base.model.estimators_) + UPDATE_TREES, n_jobs=self.n_jobs)
+        self.model.fit(X, y)
+        self.model.set_params(n_jobs=PREDICT_N_JOBS)
+        # Точность — с последнего полного обучения
+        self.accuracy = base.accuracy
         
-        self.feature_columns = [
-            'HOME_TEAM_ENCODED', 'AWAY_TEAM_ENCODED',
-            'HOME_WIN_RATE', 'AWAY_WIN_RATE',
-            'HOME_OVERALL_RATE', 'AWAY_OVERALL_RATE'
-        ]
+        logger.info(f"Модель дообучена за {time.time() - update_start:.2f} с: +{UPDATE_TREES} деревьев "
+                    f"({len(self.model.estimators_)} всего) на {len(rows)} последних матчах, новых матчей: {len(self.df) - start}")
+    
+    def _update_rows(self, classes) -> np.ndarray:
+        """Позиции последних UPDATE_WINDOW матчей по дате; редкие исходы добираются из истории,
+        чтобы у новых деревьев были те же классы, что у прежних"""
+        # Дата — из DATE: в YEAR встречаются опечатки
+        dates = pd.to_datetime(self.df['DATE'], format='%m/%d/%Y').to_numpy().astype('datetime64[D]').astype(np.int64)
+        order = np.argsort(-dates, kind='stable')
+        rows = order[:UPDATE_WINDOW]
         
-        self.df_processed = df_preds
+        winner_code = self.df['WINNER_CODE'].to_numpy()
+        present = set(np.unique(winner_code[rows]))
+        extra = [order[winner_code[order] == cls][:10] for cls in classes if cls not in present]
+        return np.concatenate([rows, *extra]) if extra else rows
     
     def _train_model(self):
 
-        X = self.df_processed[self.feature_columns]
-        y = self.df_processed['WINNER_CODE']
+        # Обучаем на массиве, а не на фрейме: прогноз тогда тоже идёт по массиву, без фрейма и проверки имён колонок.
+        # Признаки каждой строки — только по матчам до неё, поэтому результат матча в них не просачивается
+        X = self._training_matrix()
+        y = self.df['WINNER_CODE'].to_numpy()
         
         X_train, X_test, y_train, y_test = train_test_split(
             X, y, test_size=0.2, random_state=21, stratify=y
         )
 
-        self.model = RandomForestClassifier(n_estimators=100, random_state=21)
+        train_start = time.time()
+        self.model = RandomForestClassifier(n_estimators=100, random_state=21, n_jobs=self.n_jobs)
         self.model.fit(X_train, y_train)
+        self.model.set_params(n_jobs=PREDICT_N_JOBS)
+        train_time = time.time() - train_start
 
         y_pred = self.model.predict(X_test)
-        accuracy = accuracy_score(y_test, y_pred)
+        self.accuracy = accuracy_score(y_test, y_pred)
         
-        logger.info(f"Модель обучена. Точность: {accuracy:.2%}")
+        logger.info(f"Модель обучена за {train_time:.2f} с (n_jobs={self.n_jobs}). Точность: {self.accuracy:.2%}")
     
-    def predict_match(self, home_team: str, away_team: str) -> Dict:
-
-        if home_team not in self.team_stats or away_team not in self.team_stats:
-            return {"error": "Одна из команд не найдена в базе данных"}
+    def _build_proba_matrix(self):
+        """Вероятности исходов для всех пар хозяева × гости одним вызовом predict_proba.
         
-        if home_team == away_team:
-            return {"error": "Команды не могут быть одинаковыми"}
+        Признаки будущего матча — состояние команд после последних игр в данных, то есть
+        зависят только от пары команд, поэтому одиночный прогноз — чтение ячейки.
+        Матрица строится заново при каждом обучении, загрузке или дообучении модели.
+        """
+        build_start = time.time()
+        # Позиция команды — её int-код, как в MatchFeatures и _team_codes, а не порядок team_stats из артефакта
+        self.matrix_teams = list(self.df['HOMETEAM'].cat.categories)
+        self._team_pos = {team: i for i, team in enumerate(self.matrix_teams)}
+        self._team_encoded = self._team_codes()
         
-
-        home_encoded = self.le.transform([home_team])[0]
-        away_encoded = self.le.transform([away_team])[0]
+        n = len(self.matrix_teams)
+        home_pos, away_pos = np.nonzero(~np.eye(n, dtype=bool))
+        self.proba_matrix = np.full((n, n, len(self.model.classes_)), np.nan)
+        self.proba_matrix[home_pos, away_pos] = self._predict_proba(home_pos, away_pos)
         
-        home_win_rate = self.team_stats.get(home_team, {}).get('home_win_rate', 0)
-        away_win_rate = self.team_stats.get(away_team, {}).get('away_win_rate', 0)
-        home_overall = self.team_stats.get(home_team, {}).get('overall_win_rate', 0)
-        away_overall = self.team_stats.get(away_team, {}).get('overall_win_rate', 0)
+        logger.info(f"Матрица вероятностей {n}×{n} построена за {(time.time() - build_start) * 1000:.0f} мс")
+    
+    def _predict_proba(self, home_pos: np.ndarray, away_pos: np.ndarray) -> np.ndarray:
+        """predict_proba для пар позиций команд: одна матрица признаков — один проход по лесу.
         
-        prediction_data = pd.DataFrame([{
-            'HOME_TEAM_ENCODED': home_encoded,
-            'AWAY_TEAM_ENCODED': away_encoded,
-            'HOME_WIN_RATE': home_win_rate,
-            'AWAY_WIN_RATE': away_win_rate,
-            'HOME_OVERALL_RATE': home_overall,
-            'AWAY_OVERALL_RATE': away_overall
-        }])
+        Матрица — обычный массив в порядке FEATURE_COLUMNS: коды команд и состояние из
+        MatchFeatures, без фреймов pandas. Общий заранее выделенный буфер не используем:
+        прогнозы идут из нескольких потоков пула.
+        """
+        X = np.empty((len(home_pos), len(self.FEATURE_COLUMNS)), dtype=np.float32)
+        X[:, 0] = self._team_encoded[home_pos]  # HOME_TEAM_ENCODED
+        X[:, 1] = self._team_encoded[away_pos]  # AWAY_TEAM_ENCODED
+        X[:, 2:] = self.features.serving_matrix(home_pos, away_pos)
+        return self.model.predict_proba(X)
+    
+    def predict_pair_proba(self, home_team: str, away_team: str) -> np.ndarray:
+        """Вероятности исходов (в порядке model.classes_) прямым проходом по лесу, минуя матрицу"""
+        return self._predict_proba(np.array([self._team_pos[home_team]]), np.array([self._team_pos[away_team]]))[0]
+    
+    def _check_pair(self, home_team: str, away_team: str) -> Optional[Dict]:
+        if home_team not in self._team_pos or away_team not in self._team_pos:
+            return {"error": "Одна из команд не найдена в базе данных"}
         
-
-        prediction = self.model.predict(prediction_data)[0]
-        probabilities = self.model.predict_proba(prediction_data)[0]
-
+        if home_team == away_team:
+            return {"error": "Команды не могут быть одинаковыми"}
+        return None
+    
+    def _format_prediction(self, home_team: str, away_team: str, probabilities: np.ndarray) -> Dict:
         result_map = {
             0: {"result": "away_win", "description": f"Победа {away_team}"},
             1: {"result": "home_win", "description": f"Победа {home_team}"},
             2: {"result": "draw", "description": "Ничья"}
         }
-
+        
         prob_map = {}
         for i, class_idx in enumerate(self.model.classes_):
             if class_idx == 0:
@@ -141,6 +346,9 @@ class PredictionEngine:
             elif class_idx == 2:
                 prob_map["draw"] = float(probabilities[i])
         
+        # Класс — как у model.predict: первый с наибольшей вероятностью
+        prediction = self.model.classes_[int(np.argmax(probabilities))]
+        
         return {
             "home_team": home_team,
             "away_team": away_team,
@@ -152,18 +360,46 @@ class PredictionEngine:
             }
         }
     
+    def predict_match(self, home_team: str, away_team: str) -> Dict:
+        error = self._check_pair(home_team, away_team)
+        if error is not None:
+            return error
+        
+        probabilities = self.proba_matrix[self._team_pos[home_team], self._team_pos[away_team]]
+        return self._format_prediction(home_team, away_team, probabilities)
+    
+    def predict_matches(self, pairs: List[Tuple[str, str]]) -> List[Dict]:
+        """Прогнозы для списка пар (хозяева, гости) — например, всего игрового дня.
+        
+        Пары считаются одним вызовом predict_proba, а не по одной; результат —
+        в порядке pairs, для некорректных пар — {"error": ...}, как у predict_match.
+        """
+        results: List[Optional[Dict]] = [self._check_pair(home, away) for home, away in pairs]
+        valid = [i for i, result in enumerate(results) if result is None]
+        if not valid:
+            return results
+        
+        home_pos = np.array([self._team_pos[pairs[i][0]] for i in valid])
+        away_pos = np.array([self._team_pos[pairs[i][1]] for i in valid])
+        probabilities = self._predict_proba(home_pos, away_pos)
+        
+        for i, row in zip(valid, probabilities):
+            results[i] = self._format_prediction(pairs[i][0], pairs[i][1], row)
+        return results
+    
     def get_head_to_head_stats(self, team1: str, team2: str) -> Dict:
 
-        df_games = self.df[
-            ((self.df['HOMETEAM'] == team1) & (self.df['AWAYTEAM'] == team2)) |
-            ((self.df['HOMETEAM'] == team2) & (self.df['AWAYTEAM'] == team1))
-        ]
+        teams = self.df['HOMETEAM'].cat.categories
+        code1 = teams.get_loc(team1) if team1 in teams else -2
+        code2 = teams.get_loc(team2) if team2 in teams else -2
+        
+        df_games = self.df.iloc[self.index.pair(team1, team2)]
         
         if len(df_games) == 0:
             return {"total_games": 0}
         
-        team1_wins = len(df_games[df_games['WINNER'] == team1])
-        team2_wins = len(df_games[df_games['WINNER'] == team2])
+        team1_wins = int((df_games['WINNER_ID'] == code1).sum())
+        team2_wins = int((df_games['WINNER_ID'] == code2).sum())
         total = len(df_games)
         
         return {
@@ -173,4 +409,37 @@ class PredictionEngine:
             f"{team1}_winrate": team1_wins / total if total > 0 else 0,
             f"{team2}_winrate": team2_wins / total if total > 0 else 0,
             "last_games": df_games[['HOMETEAM', 'AWAYTEAM', 'SCORE', 'WINNER']].tail(5).to_dict('records')
-        }
\ No newline at end of file
+        }
+
+
+# Реестр обученных моделей: одна модель на версию набора данных для всего процесса
+_engines: Dict[int, PredictionEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_prediction_engine(dataset: Dataset, n_jobs: Optional[int] = -1) -> PredictionEngine:
+    """Общий обученный PredictionEngine для набора данных (обучается один раз)"""
+    with _engines_lock:
+        engine = _engines.get(dataset.version)
+        if engine is None or engine.dataset is not dataset:
+            engine = PredictionEngine(dataset, n_jobs=n_jobs)
+            _engines.clear()
+            _engines[dataset.version] = engine
+        return engine
+
+
+def update_prediction_engine(engine: PredictionEngine, dataset: Dataset) -> PredictionEngine:
+    """Модель для новой версии данных на основе engine (дообучение, если матчи только дописаны).
+
+    Обучение идёт без блокировки реестра: до подмены запросы обслуживает engine.
+    """
+    with _engines_lock:
+        current = _engines.get(dataset.version)
+        if current is not None and current.dataset is dataset:
+            return current
+    
+    updated = engine.updated(dataset)
+    with _engines_lock:
+        _engines.clear()
+        _engines[dataset.version] = updated
+    return updated
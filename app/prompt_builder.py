@@ -0,0 +1,96 @@
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Бюджет токенов на статистическую часть промпта
+PROMPT_TOKEN_BUDGET = int(os.getenv("KHL_PROMPT_TOKEN_BUDGET", "700"))
+# Если осталось меньше — следующие факты даже не вычисляем
+MIN_FACT_TOKENS = 16
+
+_encodings: Dict[str, object] = {}
+_encodings_lock = threading.Lock()
+
+
+def _get_encoding(model: str):
+    """Кодировка tiktoken для модели; None, если tiktoken или словарь недоступны (например, без сети)"""
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                import tiktoken
+                try:
+                    _encodings[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _encodings[model] = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken недоступен, токены считаются приблизительно: {e}")
+                _encodings[model] = None
+        return _encodings[model]
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        # Грубая оценка: ~3 символа на токен для смеси кириллицы, цифр и латиницы
+        return len(text) // 3 + 1
+    return len(encoding.encode(text))
+
+
+# Факт промпта: (ключ, приоритет — меньше важнее, функция, возвращающая текст)
+PromptFact = Tuple[str, int, Callable[[], str]]
+
+
+class PromptBuilder:
+    """Собирает факты в промпт в пределах бюджета токенов.
+
+    Факты берутся по приоритету, пока помещаются в бюджет, а в тексте
+    остаются в исходном порядке. Текст факта вычисляется только при попытке
+    его взять — отброшенные по бюджету факты не считаются.
+    """
+
+    def __init__(self, budget: int = PROMPT_TOKEN_BUDGET, model: str = "gpt-3.5-turbo"):
+        self.budget = budget
+        self.model = model
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def pack(self, facts: List[PromptFact], budget: Optional[int] = None) -> Dict:
+        budget = self.budget if budget is None else budget
+        order = sorted(range(len(facts)), key=lambda i: (facts[i][1], i))
+
+        chosen = {}
+        included, dropped = [], []
+        used = 0
+
+        for i in order:
+            key, _, render = facts[i]
+            if budget - used < MIN_FACT_TOKENS:
+                dropped.append(key)
+                continue
+
+            text = render()
+            if not text:
+                continue
+
+            tokens = self.count(text)
+            if used + tokens > budget:
+                dropped.append(key)
+                continue
+
+            chosen[i] = text
+            included.append(key)
+            used += tokens
+
+        text = "\n".join(chosen[i] for i in sorted(chosen))
+        return {
+            "text": text,
+            "tokens": self.count(text),
+            "budget": budget,
+            "included": included,
+            "dropped": dropped
+        }
@@ -1,56 +1,386 @@
+import asyncio
+import functools
+import heapq
+import inspect
+import os
+import sys
+import threading
 import time
+from collections import OrderedDict
 
-cache_storage = {}
+# Ограничения кэша: число записей и примерный объём значений в байтах
+MAX_ENTRIES = int(os.getenv("KHL_CACHE_MAX_ENTRIES", "2048"))
+MAX_BYTES = int(os.getenv("KHL_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
 
-def save_to_cache(key, value, ttl_seconds=1800):
-    cache_storage[key] = {
-        'value': value,
-        'expires_at': time.time() + ttl_seconds
-    }
+# TTL по пространствам имён (префикс ключа из make_cache_key)
+DEFAULT_TTL = 1800
+NAMESPACE_TTLS = {
+    "team_stats": 1800,
+    "h2h": 1800,
+    "last_games": 600,
+    "form_stats": 600,
+    "season_table": 3600,
+    "top_winners": 1800,
+    "top_points": 1800,
+    "top_winrate": 1800,
+    "top_scorers": 1800,
+    "ai_answer": 3600,
+    "plot": 3600,
+    "plot_file_id": 86400,
+}
+# Пространства имён от длинных к коротким: «plot_file_id» проверяется раньше «plot»
+_NAMESPACES_BY_LENGTH = tuple(sorted(NAMESPACE_TTLS, key=len, reverse=True))
+
+# key -> {'value', 'expires_at', 'size', 'namespace', 'tags'}; порядок — от давно использованных к свежим
+cache_storage = OrderedDict()
+# Тег (команда, сезон, ...) -> ключи записей с этим тегом — для точечной инвалидации
+_tag_index = {}
+# Версия данных последней инвалидации: значения, посчитанные по более старым данным, не сохраняются.
+# Одно число, а не карта по тегам, — память не растёт с потоком дописываемых матчей
+_min_version = None
+_expiry_heap = []
+_total_bytes = 0
+_lock = threading.RLock()
+_counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "coalesced": 0, "invalidations": 0}
+
+# Вычисления «в полёте»: (key, версия данных) -> _Flight (потоки) / asyncio.Task (корутины).
+# Версия в ключе: ключ кэша при дописывании матчей не меняется, и запрос от нового калькулятора
+# не должен получить результат вычисления, начатого прежним
+_inflight = {}
+_async_inflight = {}
+
+
+def _namespace_of(key):
+    for namespace in _NAMESPACES_BY_LENGTH:
+        if key == namespace or key.startswith(namespace + "_"):
+            return namespace
+    return "default"
+
+
+def _estimate_size(value, _seen=None):
+    """Примерный размер значения в байтах (рекурсивно по контейнерам)"""
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(_estimate_size(k, _seen) + _estimate_size(v, _seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(_estimate_size(item, _seen) for item in value)
+    return size
+
+
+def _remove(key):
+    global _total_bytes
+    data = cache_storage.pop(key)
+    _total_bytes -= data['size']
+    for tag in data['tags']:
+        keys = _tag_index.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del _tag_index[tag]
+
+
+def _expire(now):
+    """Удаляет просроченные записи с вершины кучи — амортизированно O(log n) на запись"""
+    while _expiry_heap and _expiry_heap[0][0] <= now:
+        expires_at, key = heapq.heappop(_expiry_heap)
+        data = cache_storage.get(key)
+        # Запись могла быть перезаписана с новым сроком — тогда элемент кучи устарел
+        if data is not None and data['expires_at'] == expires_at:
+            _remove(key)
+            _counters["expirations"] += 1
+
+    # Устаревшие элементы кучи не должны копиться бесконечно
+    if len(_expiry_heap) > 2 * len(cache_storage) + 64:
+        _expiry_heap[:] = [(data['expires_at'], key) for key, data in cache_storage.items()]
+        heapq.heapify(_expiry_heap)
+
+
+def _evict_lru():
+    while cache_storage and (len(cache_storage) > MAX_ENTRIES or _total_bytes > MAX_BYTES):
+        oldest_key = next(iter(cache_storage))
+        _remove(oldest_key)
+        _counters["evictions"] += 1
+
+
+def _is_stale(version):
+    """Значение посчитано по данным старее последней инвалидации"""
+    return version is not None and _min_version is not None and version < _min_version
+
+
+def save_to_cache(key, value, ttl_seconds=None, tags=None, version=None):
+    """Сохраняет значение; version — версия данных, по которой оно посчитано.
+
+    Значение не сохраняется, если кэш уже сброшен для более новой версии:
+    вычисление по прежнему калькулятору, закончившееся после invalidate_tags,
+    не вернёт в кэш устаревшие данные.
+    """
+    global _total_bytes
+    namespace = _namespace_of(key)
+    if ttl_seconds is None:
+        ttl_seconds = NAMESPACE_TTLS.get(namespace, DEFAULT_TTL)
+
+    size = _estimate_size(value)
+    if size > MAX_BYTES:
+        return False
+
+    with _lock:
+        if _is_stale(version):
+            return False
+
+        now = time.time()
+        _expire(now)
+
+        if key in cache_storage:
+            _remove(key)
+
+        expires_at = now + ttl_seconds
+        cache_storage[key] = {
+            'value': value,
+            'expires_at': expires_at,
+            'size': size,
+            'namespace': namespace,
+            'tags': frozenset(tags or ())
+        }
+        for tag in cache_storage[key]['tags']:
+            _tag_index.setdefault(tag, set()).add(key)
+        _total_bytes += size
+        heapq.heappush(_expiry_heap, (expires_at, key))
+        _evict_lru()
     return True
 
+
 def get_from_cache(key):
-    if key in cache_storage:
-        data = cache_storage[key]
-        if time.time() < data['expires_at']:
+    with _lock:
+        now = time.time()
+        _expire(now)
+
+        data = cache_storage.get(key)
+        if data is not None and now < data['expires_at']:
+            cache_storage.move_to_end(key)
+            _counters["hits"] += 1
             return data['value']
-        else:
-            del cache_storage[key]
+
+        _counters["misses"] += 1
     return None
 
+
 def make_cache_key(*args):
     parts = [str(arg).replace(" ", "_") for arg in args]
     return "_".join(parts)
 
+
+def invalidate_tags(tags, version=None):
+    """Удаляет записи, помеченные хотя бы одним из тегов; возвращает число удалённых.
+
+    С version значения, посчитанные по более старым данным, больше не сохраняются.
+    """
+    global _min_version
+    with _lock:
+        if version is not None:
+            _min_version = version if _min_version is None else max(_min_version, version)
+        keys = set()
+        for tag in tags:
+            keys |= _tag_index.get(tag, set())
+        for key in keys:
+            _remove(key)
+        _counters["invalidations"] += len(keys)
+        return len(keys)
+
+
 def clear_cache():
-    count = len(cache_storage)
-    cache_storage.clear()
+    global _total_bytes, _min_version
+    with _lock:
+        count = len(cache_storage)
+        cache_storage.clear()
+        _tag_index.clear()
+        _min_version = None
+        _expiry_heap.clear()
+        _total_bytes = 0
     return count
 
+
 def get_cache_stats():
-    now = time.time()
-    total = len(cache_storage)
-    active = 0
-    
-    for key, data in cache_storage.items():
-        if now < data['expires_at']:
-            active += 1
-    
-    return {
-        "total_entries": total,
-        "active_entries": active,
-        "expired_entries": total - active
-    }
+    with _lock:
+        now = time.time()
+        total = len(cache_storage)
+        active = sum(1 for data in cache_storage.values() if now < data['expires_at'])
+
+        namespaces = {}
+        for data in cache_storage.values():
+            namespaces[data['namespace']] = namespaces.get(data['namespace'], 0) + 1
+
+        lookups = _counters["hits"] + _counters["misses"]
+
+        return {
+            "total_entries": total,
+            "active_entries": active,
+            "expired_entries": total - active,
+            "total_bytes": _total_bytes,
+            "max_entries": MAX_ENTRIES,
+            "max_bytes": MAX_BYTES,
+            "hits": _counters["hits"],
+            "misses": _counters["misses"],
+            "hit_rate": round(_counters["hits"] / lookups, 3) if lookups else 0.0,
+            "evictions": _counters["evictions"],
+            "expirations": _counters["expirations"],
+            "coalesced": _counters["coalesced"],
+            "invalidations": _counters["invalidations"],
+            "inflight": len(_inflight) + len(_async_inflight),
+            "namespaces": namespaces
+        }
+
 
 def cleanup_expired():
-    now = time.time()
-    expired_keys = []
-    
-    for key, data in cache_storage.items():
-        if now >= data['expires_at']:
-            expired_keys.append(key)
-    
-    for key in expired_keys:
-        del cache_storage[key]
-    
-    return len(expired_keys)
+    with _lock:
+        before = _counters["expirations"]
+        _expire(time.time())
+        return _counters["expirations"] - before
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def get_or_compute(key, compute, ttl_seconds=None, tags=None, version=None):
+    """Значение из кэша или однократное вычисление: параллельные промахи по ключу ждут первого"""
+    value = get_from_cache(key)
+    if value is not None:
+        return value
+
+    with _lock:
+        data = cache_storage.get(key)
+        if data is not None and time.time() < data['expires_at']:
+            return data['value']
+
+        flight_key = (key, version)
+        flight = _inflight.get(flight_key)
+        leader = flight is None
+        if leader:
+            flight = _inflight[flight_key] = _Flight()
+        else:
+            _counters["coalesced"] += 1
+
+    if not leader:
+        flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    try:
+        flight.value = compute()
+        if flight.value is not None:
+            save_to_cache(key, flight.value, ttl_seconds, tags, version)
+        return flight.value
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(flight_key, None)
+        flight.event.set()
+
+
+async def _acompute(key, compute, ttl_seconds, tags, version):
+    try:
+        value = await compute()
+        if value is not None:
+            save_to_cache(key, value, ttl_seconds, tags, version)
+        return value
+    finally:
+        if _async_inflight.get((key, version)) is asyncio.current_task():
+            del _async_inflight[(key, version)]
+
+
+def _consume_result(task):
+    # Ошибку могли не забрать (все ожидавшие отменены) — помечаем полученной, чтобы asyncio не ругался
+    if not task.cancelled():
+        task.exception()
+
+
+async def aget_or_compute(key, compute, ttl_seconds=None, tags=None, version=None):
+    """Асинхронный вариант get_or_compute: compute — корутинная функция без аргументов.
+
+    Вычисление идёт отдельной задачей, и все, включая первого запросившего, ждут её через
+    shield: отмена одного ожидающего (например, таймаут обработчика) не отменяет остальных.
+    """
+    value = get_from_cache(key)
+    if value is not None:
+        return value
+
+    task = _async_inflight.get((key, version))
+    if task is not None:
+        _counters["coalesced"] += 1
+    else:
+        task = asyncio.ensure_future(_acompute(key, compute, ttl_seconds, tags, version))
+        task.add_done_callback(_consume_result)
+        _async_inflight[(key, version)] = task
+    return await asyncio.shield(task)
+
+
+def cached(namespace, ttl_seconds=None):
+    """Декоратор: кэш + схлопывание параллельных запросов.
+
+    Ключ — make_cache_key(namespace, *аргументы со значениями по умолчанию);
+    для методов первый аргумент (self) в ключ не входит, но если у объекта есть
+    cache_version (поколение данных), она добавляется к ключу, а data_version
+    (версия данных) защищает от сохранения устаревшего значения. Значения аргументов
+    (команды, сезоны) становятся тегами записи для invalidate_tags; кортеж (все
+    названия клуба) даёт тег на каждое название.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        params = list(signature.parameters)
+        skip_self = bool(params) and params[0] == "self"
+
+        def bind(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            values = list(bound.arguments.values())
+            prefix = []
+            data_version = None
+            if skip_self:
+                version = getattr(values[0], "cache_version", None)
+                prefix = [] if version is None else [version]
+                data_version = getattr(values[0], "data_version", None)
+                values = values[1:]
+            tags = set()
+            for value in values:
+                if isinstance(value, tuple):
+                    tags.update(str(item) for item in value)
+                else:
+                    tags.add(str(value))
+            return make_cache_key(namespace, *prefix, *values), tags, data_version
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key, tags, version = bind(args, kwargs)
+                return await aget_or_compute(key, lambda: func(*args, **kwargs), ttl_seconds, tags, version)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key, tags, version = bind(args, kwargs)
+            return get_or_compute(key, lambda: func(*args, **kwargs), ttl_seconds, tags, version)
+
+        def refresh(*args, **kwargs):
+            """Пересчитать и перезаписать значение (прогрев); для методов self передаётся явно"""
+            value = func(*args, **kwargs)
+            if value is not None:
+                key, tags, version = bind(args, kwargs)
+                save_to_cache(key, value, ttl_seconds, tags, version)
+            return value
+
+        wrapper.refresh = refresh
+        return wrapper
+
+    return decorator
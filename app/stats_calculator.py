@@ -1,133 +1,172 @@
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 import time
-from app.simple_cache import get_from_cache, save_to_cache, make_cache_key, cleanup_expired
+from app.simple_cache import cached
+from app.data_loader import Dataset
+
+# Команда — название из данных или кортеж всех названий переименованного клуба (основное первым)
+Team = Union[str, Tuple[str, ...]]
 
 class StatsCalculator:
-    def __init__(self, df: pd.DataFrame):
-        self.df = df.copy()
-        print(f"📊 StatsCalculator инициализирован с {len(df)} записями")
+    # Поля агрегатного куба (team, season, venue)
+    CUBE_FIELDS = ('games', 'wins', 'ot_losses', 'goals_for', 'goals_against', 'points')
+    HOME, AWAY = 0, 1
+
+    def __init__(self, dataset: Dataset, base: 'StatsCalculator' = None):
+        # Общий фрейм DataLoader — без копии
+        self.dataset = dataset
+        self.df = dataset.df
+        self.index = dataset.index
+        # Поколение данных в ключах кэша: после полной перезагрузки CSV прежние записи не читаются
+        self.cache_version = f"g{dataset.generation}"
+        # Версия данных: значение, посчитанное по прежней версии, не перезапишет сброшенную запись
+        self.data_version = dataset.version
+        self._build_cube(base)
+        print(f"📊 StatsCalculator инициализирован с {len(self.df)} записями")
     
-    def _get_team_stats_cached(self, team_name: str, season_id: Optional[str] = None) -> Dict:
-        cache_key = make_cache_key("team_stats", team_name, season_id or "all")
-        cached_result = get_from_cache(cache_key)
-        if cached_result is not None:
-            return cached_result
-        
-        print(f"🔍 РАСЧЕТ: статистика {team_name} {season_id or 'all seasons'}")
-        calc_start = time.time()
+    def with_appended(self, dataset: Dataset) -> 'StatsCalculator':
+        """Калькулятор для набора данных с дописанными матчами: в куб добавляются только новые строки"""
+        return StatsCalculator(dataset, base=self)
+    
+    def _build_cube(self, base: 'StatsCalculator' = None):
+        """Один проход по данным: куб [команда, сезон, дома/в гостях, поле].
+        
+        С base строки base.df уже учтены в base._cube — куб копируется, а проходим только по новым строкам.
+        """
+        build_start = time.time()
+        start = len(base.df) if base is not None else 0
+        
+        # Позиция команды в кубе совпадает с её кодом в общем словаре DataLoader
+        self.cube_teams = list(self.df['HOMETEAM'].cat.categories)
+        self.cube_seasons = sorted(int(s) for s in self.df['SEASON'].unique())
+        self._team_pos = {team: i for i, team in enumerate(self.cube_teams)}
+        self._season_pos = {season: i for i, season in enumerate(self.cube_seasons)}
+        
+        rows = self.df.iloc[start:]
+        home_idx = rows['HOME_ID'].to_numpy()
+        away_idx = rows['AWAY_ID'].to_numpy()
+        season_idx = np.searchsorted(self.cube_seasons, rows['SEASON'].to_numpy())
+        
+        home_win = rows['HOME_WIN'].to_numpy()
+        away_win = (rows['WINNER_CODE'] == 0).to_numpy()
+        extra_time = (rows['IS_OT'] | rows['IS_SO']).to_numpy()
+        hg = rows['HG'].fillna(0).to_numpy(dtype=np.int64)
+        ag = rows['AG'].fillna(0).to_numpy(dtype=np.int64)
+        home_points = rows['HOME_POINTS'].to_numpy(dtype=np.int64)
+        away_points = rows['AWAY_POINTS'].to_numpy(dtype=np.int64)
+        
+        self._cube = np.zeros((len(self.cube_teams), len(self.cube_seasons), 2, len(self.CUBE_FIELDS)), dtype=np.int64)
+        if base is not None:
+            # Коды прежних команд не меняются (новые — в конце словаря), сезоны сопоставляем по значению
+            season_map = np.searchsorted(self.cube_seasons, base.cube_seasons)
+            self._cube[:len(base.cube_teams), season_map] = base._cube
+        
+        for venue, team_idx, wins, ot_losses, goals_for, goals_against, points in (
+            (self.HOME, home_idx, home_win, extra_time & away_win, hg, ag, home_points),
+            (self.AWAY, away_idx, away_win, extra_time & home_win, ag, hg, away_points),
+        ):
+            valid = team_idx >= 0
+            values = np.column_stack([
+                np.ones(len(rows), dtype=np.int64), wins, ot_losses,
+                goals_for, goals_against, points
+            ])[valid]
+            np.add.at(self._cube, (team_idx[valid], season_idx[valid], venue), values)
+        
+        build_time = (time.time() - build_start) * 1000
+        print(f"🧊 Агрегатный куб построен за {build_time:.1f} мс по {len(rows)} строкам "
+              f"({len(self.cube_teams)} команд × {len(self.cube_seasons)} сезонов)")
+    
+    @staticmethod
+    def _names(team: Team) -> Tuple[str, ...]:
+        return (team,) if isinstance(team, str) else tuple(team)
+    
+    def _team_games(self, team: Team) -> np.ndarray:
+        """Позиции игр команды — по всем названиям клуба"""
+        names = self._names(team)
+        if len(names) == 1:
+            return self.index.team(names[0])
+        return np.sort(np.concatenate([self.index.team(name) for name in names]))
+    
+    def _lookup_cube(self, team: Team, season_id: Optional[str], venues) -> Optional[np.ndarray]:
+        team_pos = [self._team_pos[name] for name in self._names(team) if name in self._team_pos]
+        if not team_pos:
+            return None
         
         if season_id and season_id != "all":
-            df_filtered = self.df[self.df['SEASON'] == int(season_id)]
+            season_pos = self._season_pos.get(int(season_id))
+            if season_pos is None:
+                return None
+            cells = self._cube[team_pos, season_pos][:, venues]
         else:
-            df_filtered = self.df
-        
-        df_our_team = df_filtered[
-            (df_filtered['HOMETEAM'] == team_name) | 
-            (df_filtered['AWAYTEAM'] == team_name)
-        ].copy()
+            cells = self._cube[team_pos][:, :, venues].sum(axis=1)
         
-        if len(df_our_team) == 0:
-            result = {}
+        return cells.sum(axis=(0, 1))
+    
+    def _season_totals(self, season_id: str) -> pd.DataFrame:
+        """Суммы куба по обеим площадкам: строка на команду, сыгравшую в сезоне"""
+        if season_id == "all":
+            totals = self._cube.sum(axis=(1, 2))
         else:
-            df_our_team['LOSER'] = df_our_team.apply(
-                lambda row: row['AWAYTEAM'] if row['WINNER'] == row['HOMETEAM'] else row['HOMETEAM'],
-                axis=1
-            )
-            
-            df_our_team['POINTS'] = df_our_team.apply(
-                lambda row: 2 if row['WINNER'] == team_name
-                else 1 if row['WINNER'] != team_name and row['ADD'] in ['AOT', 'PEN']
-                else 0,
-                axis=1
-            )
-            
-            df_our_team['GOALS'] = df_our_team.apply(
-                lambda row: row['HG'] if row['HOMETEAM'] == team_name else row['AG'],
-                axis=1
-            )
-            
-            df_our_team['MISSED'] = df_our_team.apply(
-                lambda row: row['AG'] if row['HOMETEAM'] == team_name else row['HG'],
-                axis=1
-            )
-            
-            scored_goals = df_our_team['GOALS'].sum()
-            missed_goals = df_our_team['MISSED'].sum()
-            wins = len(df_our_team[df_our_team['WINNER'] == team_name])
-            total = len(df_our_team)
-            points = df_our_team['POINTS'].sum()
-            
-            if total == 0:
-                result = {
-                    'team': team_name,
-                    'games': 0,
-                    'wins': 0,
-                    'losses': 0,
-                    'win_rate': "0.0%",
-                    'goals_scored': 0,
-                    'goals_conceded': 0,
-                    'goal_difference': 0,
-                    'points': 0,
-                    'avg_goals_per_game': "0.0",
-                    'avg_conceded_per_game': "0.0"
-                }
-            else:
-                result = {
-                    'team': team_name,
-                    'games': total,
-                    'wins': wins,
-                    'losses': total - wins,
-                    'win_rate': f"{(wins/total*100):.1f}%",
-                    'goals_scored': int(scored_goals),
-                    'goals_conceded': int(missed_goals),
-                    'goal_difference': int(scored_goals - missed_goals),
-                    'points': int(points),
-                    'avg_goals_per_game': f"{(scored_goals/total):.1f}",
-                    'avg_conceded_per_game': f"{(missed_goals/total):.1f}",
-                    'cached': False
-                }
-        
-        save_to_cache(cache_key, result, ttl_seconds=1800)
-        calc_time = (time.time() - calc_start) * 1000
-        print(f"✅ РАССЧИТАНО: {team_name} за {calc_time:.1f} мс")
-        return result
+            season_pos = self._season_pos.get(int(season_id))
+            if season_pos is None:
+                return pd.DataFrame(columns=self.CUBE_FIELDS)
+            totals = self._cube[:, season_pos].sum(axis=1)
+        
+        totals = pd.DataFrame(totals, index=self.cube_teams, columns=self.CUBE_FIELDS)
+        return totals[totals['games'] > 0]
     
-    def get_team_stats(self, team_name: str, season_id: Optional[str] = None) -> Dict:
-        return self._get_team_stats_cached(team_name, season_id)
+    def _stats_from_cube(self, team: Team, season_id: Optional[str], venues) -> Dict:
+        team_name = self._names(team)[0]
+        totals = self._lookup_cube(team, season_id, venues)
+        if totals is None or totals[0] == 0:
+            return {}
+        
+        total, wins, _, scored_goals, missed_goals, points = (int(v) for v in totals)
+        
+        return {
+            'team': team_name,
+            'games': total,
+            'wins': wins,
+            'losses': total - wins,
+            'win_rate': f"{(wins/total*100):.1f}%",
+            'goals_scored': scored_goals,
+            'goals_conceded': missed_goals,
+            'goal_difference': scored_goals - missed_goals,
+            'points': points,
+            'avg_goals_per_game': f"{(scored_goals/total):.1f}",
+            'avg_conceded_per_game': f"{(missed_goals/total):.1f}",
+            'cached': False
+        }
     
-    def get_head_to_head(self, team1: str, team2: str, season_id: Optional[str] = None) -> Dict:
-        cache_key = make_cache_key("h2h", team1, team2, season_id or "all")
-        cached = get_from_cache(cache_key)
-        if cached is not None:
-            return cached
-        
+    def get_team_stats(self, team_name: Team, season_id: Optional[str] = None) -> Dict:
+        return self._stats_from_cube(team_name, season_id, [self.HOME, self.AWAY])
+    
+    @cached("h2h")
+    def get_head_to_head(self, team1: Team, team2: Team, season_id: Optional[str] = None) -> Dict:
+        names1, names2 = self._names(team1), self._names(team2)
+        team1, team2 = names1[0], names2[0]
         print(f"🔍 РАСЧЕТ H2H: {team1} vs {team2} {season_id or 'all seasons'}")
         calc_start = time.time()
         
-        if season_id and season_id != "all":
-            df_filtered = self.df[self.df['SEASON'] == int(season_id)]
-        else:
-            df_filtered = self.df
+        codes1 = [self._team_pos[name] for name in names1 if name in self._team_pos]
+        codes2 = [self._team_pos[name] for name in names2 if name in self._team_pos]
         
-        df_games = df_filtered[
-            ((df_filtered['HOMETEAM'] == team1) & (df_filtered['AWAYTEAM'] == team2)) |
-            ((df_filtered['HOMETEAM'] == team2) & (df_filtered['AWAYTEAM'] == team1))
-        ]
+        positions = [self.index.pair(a, b, season_id or None) for a in names1 for b in names2]
+        df_games = self.df.iloc[np.sort(np.concatenate(positions)) if len(positions) > 1 else positions[0]]
         
         if len(df_games) == 0:
             result = {}
         else:
-            team1_wins = len(df_games[df_games['WINNER'] == team1])
-            team2_wins = len(df_games[df_games['WINNER'] == team2])
+            team1_wins = int(df_games['WINNER_ID'].isin(codes1).sum())
+            team2_wins = int(df_games['WINNER_ID'].isin(codes2).sum())
             total = len(df_games)
             
             
             games_list = []
             for _, row in df_games.iterrows():
                 
-                if row['HOMETEAM'] == team1:
+                if row['HOMETEAM'] in names1:
                     home_team = team1
                     away_team = team2
                     home_score = row['HG']
@@ -160,156 +199,25 @@ class StatsCalculator:
                 'cached': False
             }
         
-        save_to_cache(cache_key, result, ttl_seconds=1800)
         calc_time = (time.time() - calc_start) * 1000
         print(f"✅ РАССЧИТАНО H2H за {calc_time:.1f} мс")
         return result
     
-    def get_home_stats(self, team_name: str, season_id: Optional[str] = None) -> Dict:
-        cache_key = make_cache_key("home_stats", team_name, season_id or "all")
-        cached = get_from_cache(cache_key)
-        if cached is not None:
-            return cached
-        
-        print(f"🔍 РАСЧЕТ домашней статистики: {team_name} {season_id or 'all seasons'}")
-        
-        if season_id and season_id != "all":
-            df_filtered = self.df[self.df['SEASON'] == int(season_id)]
-        else:
-            df_filtered = self.df
-        
-        home_games = df_filtered[df_filtered['HOMETEAM'] == team_name].copy()
-        
-        if len(home_games) == 0:
-            result = {}
-        else:
-            home_games['POINTS'] = home_games.apply(
-                lambda row: 3 if row['WINNER'] == team_name and pd.isna(row['ADD'])
-                else 2 if row['WINNER'] == team_name and row['ADD'] in ['AOT', 'PEN']
-                else 1 if row['WINNER'] != team_name and row['ADD'] in ['AOT', 'PEN']
-                else 0,
-                axis=1
-            )
-            
-            wins = len(home_games[home_games['WINNER'] == team_name])
-            total = len(home_games)
-            points = home_games['POINTS'].sum()
-            goals_scored = home_games['HG'].sum()
-            goals_conceded = home_games['AG'].sum()
-            
-            if total == 0:
-                result = {
-                    'team': team_name,
-                    'games': 0,
-                    'wins': 0,
-                    'losses': 0,
-                    'win_rate': "0.0%",
-                    'goals_scored': 0,
-                    'goals_conceded': 0,
-                    'goal_difference': 0,
-                    'points': 0,
-                    'avg_goals_per_game': "0.0",
-                    'avg_conceded_per_game': "0.0"
-                }
-            else:
-                result = {
-                    'team': team_name,
-                    'games': total,
-                    'wins': wins,
-                    'losses': total - wins,
-                    'win_rate': f"{(wins/total*100):.1f}%",
-                    'goals_scored': int(goals_scored),
-                    'goals_conceded': int(goals_conceded),
-                    'goal_difference': int(goals_scored - goals_conceded),
-                    'points': int(points),
-                    'avg_goals_per_game': f"{(goals_scored/total):.1f}",
-                    'avg_conceded_per_game': f"{(goals_conceded/total):.1f}",
-                    'cached': False
-                }
-        
-        save_to_cache(cache_key, result, ttl_seconds=1800)
-        return result
+    def get_home_stats(self, team_name: Team, season_id: Optional[str] = None) -> Dict:
+        return self._stats_from_cube(team_name, season_id, [self.HOME])
     
-    def get_away_stats(self, team_name: str, season_id: Optional[str] = None) -> Dict:
-        cache_key = make_cache_key("away_stats", team_name, season_id or "all")
-        cached = get_from_cache(cache_key)
-        if cached is not None:
-            return cached
-        
-        print(f"🔍 РАСЧЕТ гостевой статистики: {team_name} {season_id or 'all seasons'}")
-        
-        if season_id and season_id != "all":
-            df_filtered = self.df[self.df['SEASON'] == int(season_id)]
-        else:
-            df_filtered = self.df
-        
-        away_games = df_filtered[df_filtered['AWAYTEAM'] == team_name].copy()
-        
-        if len(away_games) == 0:
-            result = {}
-        else:
-            away_games['POINTS'] = away_games.apply(
-                lambda row: 3 if row['WINNER'] == team_name and pd.isna(row['ADD'])
-                else 2 if row['WINNER'] == team_name and row['ADD'] in ['AOT', 'PEN']
-                else 1 if row['WINNER'] != team_name and row['ADD'] in ['AOT', 'PEN']
-                else 0,
-                axis=1
-            )
-            
-            wins = len(away_games[away_games['WINNER'] == team_name])
-            total = len(away_games)
-            points = away_games['POINTS'].sum()
-            goals_scored = away_games['AG'].sum()
-            goals_conceded = away_games['HG'].sum()
-            
-            if total == 0:
-                result = {
-                    'team': team_name,
-                    'games': 0,
-                    'wins': 0,
-                    'losses': 0,
-                    'win_rate': "0.0%",
-                    'goals_scored': 0,
-                    'goals_conceded': 0,
-                    'goal_difference': 0,
-                    'points': 0,
-                    'avg_goals_per_game': "0.0",
-                    'avg_conceded_per_game': "0.0"
-                }
-            else:
-                result = {
-                    'team': team_name,
-                    'games': total,
-                    'wins': wins,
-                    'losses': total - wins,
-                    'win_rate': f"{(wins/total*100):.1f}%",
-                    'goals_scored': int(goals_scored),
-                    'goals_conceded': int(goals_conceded),
-                    'goal_difference': int(goals_scored - goals_conceded),
-                    'points': int(points),
-                    'avg_goals_per_game': f"{(goals_scored/total):.1f}",
-                    'avg_conceded_per_game': f"{(goals_conceded/total):.1f}",
-                    'cached': False
-                }
-        
-        save_to_cache(cache_key, result, ttl_seconds=1800)
-        return result
+    def get_away_stats(self, team_name: Team, season_id: Optional[str] = None) -> Dict:
+        return self._stats_from_cube(team_name, season_id, [self.AWAY])
     
-    def get_last_games(self, team_name: str, n_games: int = 10) -> List[Dict]:
-        cache_key = make_cache_key("last_games", team_name, n_games)
-        cached = get_from_cache(cache_key)
-        if cached is not None:
-            return cached
-        
-        print(f"🔍 РАСЧЕТ последних игр: {team_name} ({n_games} игр)")
+    @cached("last_games")
+    def get_last_games(self, team_name: Team, n_games: int = 10) -> List[Dict]:
+        names = self._names(team_name)
+        print(f"🔍 РАСЧЕТ последних игр: {names[0]} ({n_games} игр)")
         
         if 'DATE' not in self.df.columns:
             result = []
         else:
-            team_games = self.df[
-                (self.df['HOMETEAM'] == team_name) | 
-                (self.df['AWAYTEAM'] == team_name)
-            ].copy()
+            team_games = self.df.iloc[self._team_games(team_name)]
             
             if len(team_games) == 0:
                 result = []
@@ -327,32 +235,28 @@ class StatsCalculator:
                         'away_team': row['AWAYTEAM'],
                         'score': score,
                         'winner': row['WINNER'],
-                        'is_home': row['HOMETEAM'] == team_name
+                        'is_home': row['HOMETEAM'] in names
                     }
                     formatted_games.append(game)
                 result = formatted_games
         
-        save_to_cache(cache_key, result, ttl_seconds=600)
         return result
     
-    def get_form_stats(self, team_name: str, n_games: int = 10) -> Dict:
-        cache_key = make_cache_key("form_stats", team_name, n_games)
-        cached = get_from_cache(cache_key)
-        if cached is not None:
-            return cached
-        
-        print(f"🔍 РАСЧЕТ формы: {team_name} ({n_games} игр)")
+    @cached("form_stats")
+    def get_form_stats(self, team_name: Team, n_games: int = 10) -> Dict:
+        names = self._names(team_name)
+        print(f"🔍 РАСЧЕТ формы: {names[0]} ({n_games} игр)")
         
         last_games = self.get_last_games(team_name, n_games)
         
         if not last_games:
             result = {}
         else:
-            wins = sum(1 for game in last_games if game['winner'] == team_name)
+            wins = sum(1 for game in last_games if game['winner'] in names)
             total = len(last_games)
             
             result = {
-                'team': team_name,
+                'team': names[0],
                 'games': total,
                 'wins': wins,
                 'losses': total - wins,
@@ -361,218 +265,105 @@ class StatsCalculator:
                 'cached': False
             }
         
-        save_to_cache(cache_key, result, ttl_seconds=600)
         return result
     
+    @cached("season_table")
     def get_season_table(self, season_id: str) -> List[Dict]:
-        cache_key = make_cache_key("season_table", season_id)
-        cached = get_from_cache(cache_key)
-        if cached is not None:
-            return cached
-        
         print(f"🔍 РАСЧЕТ таблицы сезона: {season_id}")
         calc_start = time.time()
         
-        if season_id == "all":
-            df_filtered = self.df
-        else:
-            df_filtered = self.df[self.df['SEASON'] == int(season_id)]
+        totals = self._season_totals(season_id)
         
-        if len(df_filtered) == 0:
+        if len(totals) == 0:
             result = []
         else:
-            df_for_table = df_filtered[['HOMETEAM', 'AWAYTEAM', 'WINNER', 'ADD', 'HG', 'AG']].copy()
-            
-            df_for_table['HOMEPOINTS'] = df_for_table.apply(
-                lambda row: 3 if row['HOMETEAM'] == row['WINNER'] and pd.isna(row['ADD'])
-                else 2 if row['HOMETEAM'] == row['WINNER']
-                else 0 if row['HOMETEAM'] != row['WINNER'] and pd.isna(row['ADD'])
-                else 1, axis=1
-            )
-            df_for_table['AWAYPOINTS'] = 3 - df_for_table['HOMEPOINTS']
-            
-            home_stats = df_for_table.groupby('HOMETEAM').agg({
-                'HOMETEAM': 'count',
-                'ADD': lambda x: (x.notna()).sum(),
-                'HOMEPOINTS': 'sum',
-                'WINNER': lambda x: (x == df_for_table.loc[x.index, 'HOMETEAM']).sum(),
-                'HG': 'sum',
-                'AG': 'sum'
-            }).rename(columns={
-                'HOMETEAM': 'GAMES',
-                'HOMEPOINTS': 'POINTS',
-                'WINNER': 'WINS',
-                'ADD': 'OT_LOSSES'
-            })
-            
-            away_stats = df_for_table.groupby('AWAYTEAM').agg({
-                'AWAYTEAM': 'count',
-                'ADD': lambda x: (x.notna()).sum(),
-                'AWAYPOINTS': 'sum',
-                'WINNER': lambda x: (x == df_for_table.loc[x.index, 'AWAYTEAM']).sum(),
-                'AG': 'sum',
-                'HG': 'sum'
-            }).rename(columns={
-                'AWAYTEAM': 'GAMES',
-                'AWAYPOINTS': 'POINTS',
-                'WINNER': 'WINS',
-                'ADD': 'OT_LOSSES'
-            })
-            
-            total_stats = home_stats.add(away_stats, fill_value=0).astype(int)
-            
-            if total_stats.index.name is not None:
-                total_stats = total_stats.reset_index().rename(columns={total_stats.index.name: "TEAM"})
-            else:
-                total_stats = total_stats.reset_index().rename(columns={"index": "TEAM"})
+            totals = totals.sort_values('points', ascending=False, kind='stable')
             
             table_data = []
-            for i, (_, row) in enumerate(total_stats.iterrows(), 1):
-                ot_losses = row['OT_LOSSES']
-                regular_losses = row['GAMES'] - row['WINS'] - ot_losses
-                goals_for = int(row['HG'])
-                goals_against = int(row['AG'])
-                goal_diff = goals_for - goals_against
-                
+            for i, (team, row) in enumerate(totals.iterrows(), 1):
                 table_data.append({
                     'place': i,
-                    'team': row['TEAM'],
-                    'games': int(row['GAMES']),
-                    'wins': int(row['WINS']),
-                    'ot_losses': int(ot_losses),
-                    'regular_losses': int(regular_losses),
-                    'goals_for': goals_for,
-                    'goals_against': goals_against,
-                    'goal_diff': goal_diff,
-                    'points': int(row['POINTS'])
+                    'team': team,
+                    'games': int(row['games']),
+                    'wins': int(row['wins']),
+                    'ot_losses': int(row['ot_losses']),
+                    'regular_losses': int(row['games'] - row['wins'] - row['ot_losses']),
+                    'goals_for': int(row['goals_for']),
+                    'goals_against': int(row['goals_against']),
+                    'goal_diff': int(row['goals_for'] - row['goals_against']),
+                    'points': int(row['points'])
                 })
             
-            result = sorted(table_data, key=lambda x: x['points'], reverse=True)
+            result = table_data
         
-        save_to_cache(cache_key, result, ttl_seconds=3600)
         calc_time = (time.time() - calc_start) * 1000
         print(f"✅ РАССЧИТАНА таблица сезона {season_id} за {calc_time:.1f} мс")
         return result
     
+    @cached("top_winners")
     def get_top_winners(self, season_id: str = "all", limit: int = 10) -> List[Dict]:
-        cache_key = make_cache_key("top_winners", season_id, limit)
-        cached = get_from_cache(cache_key)
-        if cached is not None:
-            return cached
-        
         print(f"🔍 РАСЧЕТ топ-{limit} по победам: {season_id}")
         
-        if season_id == "all":
-            df_filtered = self.df
-        else:
-            df_filtered = self.df[self.df['SEASON'] == int(season_id)]
+        totals = self._season_totals(season_id)
         
-        if len(df_filtered) == 0:
+        if len(totals) == 0:
             result = []
         else:
-            wins_df = df_filtered['WINNER'].value_counts().reset_index()
-            wins_df.columns = ['team', 'wins']
+            totals = totals.sort_values('wins', ascending=False, kind='stable')
             
             top_winners = []
-            for i, (_, row) in enumerate(wins_df.head(limit).iterrows(), 1):
+            for i, (team, row) in enumerate(totals.head(limit).iterrows(), 1):
                 top_winners.append({
                     'place': i,
-                    'team': row['team'],
+                    'team': team,
                     'wins': int(row['wins'])
                 })
             
             result = top_winners
         
-        save_to_cache(cache_key, result, ttl_seconds=1800)
         return result
     
+    @cached("top_points")
     def get_top_points(self, season_id: str = "all", limit: int = 10) -> List[Dict]:
-        cache_key = make_cache_key("top_points", season_id, limit)
-        cached = get_from_cache(cache_key)
-        if cached is not None:
-            return cached
-        
         print(f"🔍 РАСЧЕТ топ-{limit} по очкам: {season_id}")
         
-        if season_id == "all":
-            df_filtered = self.df
-        else:
-            df_filtered = self.df[self.df['SEASON'] == int(season_id)]
+        totals = self._season_totals(season_id)
         
-        if len(df_filtered) == 0:
+        if len(totals) == 0:
             result = []
         else:
-            df_for_table = df_filtered[['HOMETEAM', 'AWAYTEAM', 'WINNER', 'ADD', 'HG', 'AG']].copy()
-            
-            df_for_table['HOMEPOINTS'] = df_for_table.apply(
-                lambda row: 3 if row['HOMETEAM'] == row['WINNER'] and pd.isna(row['ADD'])
-                else 2 if row['HOMETEAM'] == row['WINNER']
-                else 0 if row['HOMETEAM'] != row['WINNER'] and pd.isna(row['ADD'])
-                else 1, axis=1
-            )
-            df_for_table['AWAYPOINTS'] = 3 - df_for_table['HOMEPOINTS']
-            
-            home_stats = df_for_table.groupby('HOMETEAM').agg({
-                'HOMEPOINTS': 'sum',
-            })
-            away_stats = df_for_table.groupby('AWAYTEAM').agg({
-                'AWAYPOINTS': 'sum',
-            })
-            
-            home_stats = home_stats.rename(columns={'HOMEPOINTS': 'POINTS'})
-            away_stats = away_stats.rename(columns={'AWAYPOINTS': 'POINTS'})
-            
-            total_stats = home_stats.add(away_stats, fill_value=0).astype(int)
-            total_stats = total_stats.sort_values('POINTS', ascending=False)
+            totals = totals.sort_values('points', ascending=False, kind='stable')
             
             top_points = []
-            for i, (team, points) in enumerate(total_stats.head(limit).iterrows(), 1):
+            for i, (team, row) in enumerate(totals.head(limit).iterrows(), 1):
                 top_points.append({
                     'place': i,
                     'team': team,
-                    'points': int(points['POINTS'])
+                    'points': int(row['points'])
                 })
             
             result = top_points
         
-        save_to_cache(cache_key, result, ttl_seconds=1800)
         return result
     
+    @cached("top_winrate")
     def get_top_winrate(self, season_id: str = "all", min_games: int = 10, limit: int = 10) -> List[Dict]:
-        cache_key = make_cache_key("top_winrate", season_id, min_games, limit)
-        cached = get_from_cache(cache_key)
-        if cached is not None:
-            return cached
-        
         print(f"🔍 РАСЧЕТ топ-{limit} по проценту побед: {season_id}")
         
-        if season_id == "all":
-            df_filtered = self.df
-        else:
-            df_filtered = self.df[self.df['SEASON'] == int(season_id)]
+        totals = self._season_totals(season_id)
         
-        if len(df_filtered) == 0:
+        if len(totals) == 0:
             result = []
         else:
-            df_wr = df_filtered[['HOMETEAM', 'AWAYTEAM', 'WINNER']].copy()
-            df_wr['LOSER'] = df_wr.apply(
-                lambda row: row['AWAYTEAM'] if row['WINNER'] == row['HOMETEAM'] else row['HOMETEAM'],
-                axis=1
-            )
-            
-            wins_count = df_wr['WINNER'].value_counts()
-            lost_count = df_wr['LOSER'].value_counts()
-            
             winrate_df = pd.DataFrame({
-                'WINS': wins_count,
-                'LOSSES': lost_count
-            }).fillna(0)
-            
-            winrate_df['TOTAL'] = winrate_df['WINS'] + winrate_df['LOSSES']
+                'WINS': totals['wins'],
+                'LOSSES': totals['games'] - totals['wins'],
+                'TOTAL': totals['games']
+            })
             winrate_df = winrate_df[winrate_df['TOTAL'] >= min_games]
             
             winrate_df['WINRATE'] = (winrate_df['WINS'] / winrate_df['TOTAL'] * 100).round(1)
-            winrate_df = winrate_df.sort_values('WINRATE', ascending=False)
+            winrate_df = winrate_df.sort_values('WINRATE', ascending=False, kind='stable')
             
             top_winrate = []
             for i, (team, row) in enumerate(winrate_df.head(limit).iterrows(), 1):
@@ -587,42 +378,27 @@ class StatsCalculator:
             
             result = top_winrate
         
-        save_to_cache(cache_key, result, ttl_seconds=1800)
         return result
     
+    @cached("top_scorers")
     def get_top_goal_scorers(self, season_id: str = "all", limit: int = 10) -> List[Dict]:
-        cache_key = make_cache_key("top_scorers", season_id, limit)
-        cached = get_from_cache(cache_key)
-        if cached is not None:
-            return cached
-        
         print(f"🔍 РАСЧЕТ топ-{limit} по забитым голам: {season_id}")
         
-        if season_id == "all":
-            df_filtered = self.df
-        else:
-            df_filtered = self.df[self.df['SEASON'] == int(season_id)]
+        totals = self._season_totals(season_id)
         
-        if len(df_filtered) == 0:
+        if len(totals) == 0:
             result = []
         else:
-            df_for_table = df_filtered[['HOMETEAM', 'AWAYTEAM', 'HG', 'AG']].copy()
-            
-            home_goals = df_for_table.groupby('HOMETEAM')['HG'].sum()
-            away_goals = df_for_table.groupby('AWAYTEAM')['AG'].sum()
-            
-            total_goals = home_goals.add(away_goals, fill_value=0).astype(int)
-            total_goals = total_goals.sort_values(ascending=False)
+            totals = totals.sort_values('goals_for', ascending=False, kind='stable')
             
             top_scorers = []
-            for i, (team, goals) in enumerate(total_goals.head(limit).items(), 1):
+            for i, (team, row) in enumerate(totals.head(limit).iterrows(), 1):
                 top_scorers.append({
                     'place': i,
                     'team': team,
-                    'goals': int(goals)
+                    'goals': int(row['goals_for'])
                 })
             
             result = top_scorers
         
-        save_to_cache(cache_key, result, ttl_seconds=1800)
         return result
\ No newline at end of file
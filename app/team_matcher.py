@@ -0,0 +1,169 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from data.team_names import TEAM_NAMES, TEAM_NICKNAMES
+
+# Служебные слова в названиях — по отдельности команду не определяют
+STOPWORDS = {'hc', 'хк', 'st', 'dyn', 'din', 'sp', 'red', 'star', 'ред', 'стар'}
+
+# Окончания для грубого стемминга русских слов («Спартака» → «спартак»), длинные — первыми
+RU_ENDINGS = ('ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ом', 'ем', 'ой', 'ей', 'ым', 'им',
+              'ов', 'ев', 'а', 'я', 'у', 'ю', 'е', 'ы', 'и', 'ь')
+MIN_STEM = 4
+
+_TOKEN_RE = re.compile(r"[0-9a-zа-я]+")
+_CYRILLIC_RE = re.compile(r"[а-я]")
+
+
+def _stem(token: str) -> str:
+    if not _CYRILLIC_RE.search(token):
+        return token
+    # Повторяем, пока отрезается: «сибирью» → «сибирь» → «сибир»
+    stripped = True
+    while stripped:
+        stripped = False
+        for ending in RU_ENDINGS:
+            if token.endswith(ending) and len(token) - len(ending) >= MIN_STEM:
+                token = token[:-len(ending)]
+                stripped = True
+                break
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Нижний регистр, ё→е, без эмодзи и пунктуации, со стеммингом"""
+    text = text.lower().replace('ё', 'е')
+    return [_stem(token) for token in _TOKEN_RE.findall(text)]
+
+
+class TeamMatcher:
+    """Поиск команд в свободном тексте по индексу псевдонимов.
+
+    Псевдонимы: названия из данных, русские названия из TEAM_NAMES, прозвища
+    из TEAM_NICKNAMES и уникальные слова названий («Магнитогорск»). Слово,
+    общее для нескольких клубов («Moscow»), псевдонимом не считается.
+    Запрос просматривается один раз слева направо, на каждой позиции берётся
+    самый длинный псевдоним — время линейно по длине запроса.
+
+    Переименованные клубы встречаются в данных под несколькими названиями
+    («Bars Kazan» и «Ak Bars»); у таких названий в TEAM_NICKNAMES одинаковые
+    прозвища. Все псевдонимы клуба ведут к одному названию — тому, что играло
+    в самом позднем сезоне (last_seasons), — и клуб не находится дважды.
+    Основное название — только для показа: club() отдаёт все названия клуба,
+    чтобы статистика считалась по всей его истории.
+    """
+
+    def __init__(self, teams: Iterable[str],
+                 display_names: Optional[Dict[str, str]] = None,
+                 nicknames: Optional[Dict[str, List[str]]] = None,
+                 last_seasons: Optional[Dict[str, int]] = None):
+        self.teams = list(teams)
+        display_names = TEAM_NAMES if display_names is None else display_names
+        nicknames = TEAM_NICKNAMES if nicknames is None else nicknames
+        self.canonical, self.clubs = self._canonical_names(nicknames, last_seasons or {})
+
+        # Псевдоним (кортеж токенов) -> {команда: вес}
+        self._aliases: Dict[Tuple[str, ...], Dict[str, int]] = {}
+        full_names: Dict[str, List[Tuple[str, ...]]] = {}
+
+        for team in self.teams:
+            names = [team]
+            if team in display_names:
+                names.append(display_names[team])
+            full_names[team] = [tuple(tokenize(name)) for name in names]
+
+        # Полные названия и прозвища
+        for team, phrases in full_names.items():
+            for phrase in phrases:
+                self._add(phrase, team, weight=len(phrase) + 1)
+            for nickname in nicknames.get(team, []):
+                phrase = tuple(tokenize(nickname))
+                self._add(phrase, team, weight=len(phrase))
+
+        # Отдельные слова названий, если они встречаются только у одного клуба
+        owners: Dict[str, set] = {}
+        for team, phrases in full_names.items():
+            for phrase in phrases:
+                for token in phrase:
+                    owners.setdefault(token, set()).add(self.canonical[team])
+
+        for token, token_teams in owners.items():
+            if len(token_teams) == 1 and len(token) > 3 and token not in STOPWORDS:
+                self._add((token,), next(iter(token_teams)), weight=1)
+
+        # Индекс по первому токену: кандидаты от длинных к коротким
+        self._index: Dict[str, List[Tuple[str, ...]]] = {}
+        for phrase in self._aliases:
+            self._index.setdefault(phrase[0], []).append(phrase)
+        for candidates in self._index.values():
+            candidates.sort(key=len, reverse=True)
+
+    def _canonical_names(self, nicknames: Dict[str, List[str]],
+                         last_seasons: Dict[str, int]) -> Tuple[Dict[str, str], Dict[str, Tuple[str, ...]]]:
+        """Название из данных -> основное название клуба (общие прозвища — один клуб)
+        и основное название -> все названия клуба (основное первым, дальше — от поздних к ранним)"""
+        clubs: Dict[str, set] = {team: {team} for team in self.teams}
+        by_nickname: Dict[Tuple[str, ...], str] = {}
+        for team in self.teams:
+            for nickname in nicknames.get(team, []):
+                other = by_nickname.setdefault(tuple(tokenize(nickname)), team)
+                if clubs[other] is not clubs[team]:
+                    merged = clubs[other] | clubs[team]
+                    for member in merged:
+                        clubs[member] = merged
+
+        # Основное — игравшее позже всех; при равенстве — первое по алфавиту
+        canonical, members = {}, {}
+        for team, club in clubs.items():
+            ordered = tuple(sorted(club, key=lambda name: (-last_seasons.get(name, 0), name)))
+            canonical[team] = ordered[0]
+            members[ordered[0]] = ordered
+        return canonical, members
+
+    def _add(self, phrase: Tuple[str, ...], team: str, weight: int):
+        if not phrase:
+            return
+        team = self.canonical.get(team, team)
+        alias_teams = self._aliases.setdefault(phrase, {})
+        alias_teams[team] = max(alias_teams.get(team, 0), weight)
+
+    def match(self, query: str) -> List[Dict]:
+        """Найденные команды: [{'team', 'alias', 'score', 'position'}].
+
+        Порядок — как в запросе (первая названная команда считается хозяевами
+        для H2H и прогноза); при равной позиции — более точный псевдоним.
+        """
+        tokens = tokenize(query)
+        found: Dict[str, Dict] = {}
+
+        i = 0
+        while i < len(tokens):
+            matched = None
+            for phrase in self._index.get(tokens[i], ()):
+                if tuple(tokens[i:i + len(phrase)]) == phrase:
+                    matched = phrase
+                    break
+
+            if matched is None:
+                i += 1
+                continue
+
+            for team, weight in self._aliases[matched].items():
+                current = found.get(team)
+                if current is None or weight > current['score']:
+                    found[team] = {
+                        'team': team,
+                        'alias': " ".join(matched),
+                        'score': weight,
+                        'position': current['position'] if current else i
+                    }
+            i += len(matched)
+
+        return sorted(found.values(), key=lambda item: (item['position'], -item['score'], item['team']))
+
+    def club(self, team: str) -> Tuple[str, ...]:
+        """Все названия клуба в данных (основное первым)"""
+        return self.clubs.get(self.canonical.get(team, team), (team,))
+
+    def extract(self, query: str) -> List[str]:
+        return [item['team'] for item in self.match(query)]
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Tuple
+
+from app.executor import run_blocking
+from app.stats_calculator import StatsCalculator
+
+logger = logging.getLogger(__name__)
+
+# Период обновления прогретых записей — меньше самого короткого TTL (last_games/form_stats, 600 с)
+WARMUP_INTERVAL = int(os.getenv("KHL_WARMUP_INTERVAL", "500"))
+
+
+def warmup_jobs(calculator: StatsCalculator) -> List[Tuple[Callable, tuple]]:
+    """Все кэшируемые запросы, которые делают меню бота: таблицы и топы по сезонам, форма команд.
+
+    Статистика команды (общая/дома/в гостях) читается из куба и прогрева не требует.
+    """
+    seasons = ["all"] + [str(season) for season in calculator.dataset.seasons]
+    jobs = []
+
+    for season in seasons:
+        jobs.append((calculator.get_season_table, (season,)))
+        jobs.append((calculator.get_top_winners, (season, 10)))
+        jobs.append((calculator.get_top_points, (season, 10)))
+        jobs.append((calculator.get_top_winrate, (season, 10, 10)))
+        jobs.append((calculator.get_top_goal_scorers, (season, 10)))
+
+    for team in calculator.dataset.teams:
+        jobs.append((calculator.get_last_games, (team, 10)))
+        jobs.append((calculator.get_form_stats, (team, 10)))
+
+    return jobs
+
+
+async def warm_up_cache(calculator: StatsCalculator, refresh: bool = False) -> Dict:
+    """Параллельно считает все запросы из warmup_jobs в пуле потоков.
+
+    refresh=True пересчитывает и перезаписывает записи, даже если они ещё в кэше.
+    """
+    start = time.time()
+    jobs = warmup_jobs(calculator)
+
+    async def run(method, args):
+        if refresh:
+            return await run_blocking("warmup", method.__func__.refresh, method.__self__, *args)
+        return await run_blocking("warmup", method, *args)
+
+    results = await asyncio.gather(*(run(method, args) for method, args in jobs), return_exceptions=True)
+    failed = [result for result in results if isinstance(result, Exception)]
+    duration = time.time() - start
+
+    for error in failed[:3]:
+        logger.warning(f"Ошибка прогрева кэша: {error}")
+    print(f"🔥 Кэш {'обновлён' if refresh else 'прогрет'} за {duration:.2f} с: "
+          f"{len(jobs)} запросов, ошибок: {len(failed)}")
+
+    return {
+        "jobs": len(jobs),
+        "failed": len(failed),
+        "duration_s": round(duration, 3),
+        "dataset_version": calculator.dataset.version
+    }
+
+
+async def keep_warm(get_calculator: Callable[[], StatsCalculator], interval: int = WARMUP_INTERVAL):
+    """Прогрев при старте и периодическое обновление, чтобы записи не остывали по TTL.
+
+    Калькулятор берётся через get_calculator на каждом шаге — после перезагрузки данных
+    прогревается уже новый.
+    """
+    await warm_up_cache(get_calculator())
+    while True:
+        await asyncio.sleep(interval)
+        await warm_up_cache(get_calculator(), refresh=True)
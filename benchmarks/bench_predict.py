@@ -0,0 +1,97 @@
+"""Микробенчмарк прогноза матча: задержка одного вызова до и после быстрого пути.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_predict [--repeat 200]
+"""
+import argparse
+import logging
+import statistics
+import time
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+
+from app.data_loader import loader
+from app.prediction_engine import get_prediction_engine, PredictionEngine
+
+PAIRS = [
+    ("CSKA Moscow", "SKA St. Petersburg"),
+    ("Avangard Omsk", "Sibir Novosibirsk"),
+    ("Ak Bars", "Lokomotiv Yaroslavl"),
+    ("Metallurg Magnitogorsk", "Tractor Chelyabinsk"),
+    ("Dyn. Moscow", "Sp. Moscow"),
+    ("Salavat Ufa", "Avtomobilist Yekaterinburg"),
+    ("Torpedo Nizhny Novgorod", "Severstal Cherepovets"),
+    ("Amur Khabarovsk", "Admiral Vladivostok"),
+]
+
+
+def legacy_predict(engine: PredictionEngine, home_team: str, away_team: str):
+    """Прежний путь predict_match: два LabelEncoder.transform, фрейм из одной строки, predict + predict_proba.
+
+    Модель теперь обучена на массиве, поэтому фрейм переводится в массив перед вызовом —
+    стоимость создания фрейма сохраняется, проверка имён колонок sklearn не учитывается.
+    """
+    home_encoded = engine.le.transform([home_team])[0]
+    away_encoded = engine.le.transform([away_team])[0]
+    state = engine.features.serving_matrix(
+        np.array([engine._team_pos[home_team]]), np.array([engine._team_pos[away_team]])
+    )[0]
+
+    prediction_data = pd.DataFrame([{
+        'HOME_TEAM_ENCODED': home_encoded,
+        'AWAY_TEAM_ENCODED': away_encoded,
+        **dict(zip(PredictionEngine.FEATURE_COLUMNS[2:], state))
+    }]).to_numpy(dtype=np.float32)
+
+    prediction = engine.model.predict(prediction_data)[0]
+    probabilities = engine.model.predict_proba(prediction_data)[0]
+    return prediction, probabilities
+
+
+def measure(func: Callable, repeat: int, calls_per_run: int = 1) -> Dict:
+    """Медиана и p95 задержки в мс на один прогноз"""
+    func()  # прогрев
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000 / calls_per_run)
+
+    timings.sort()
+    return {
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[int(len(timings) * 0.95) - 1]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарк PredictionEngine")
+    parser.add_argument("--repeat", type=int, default=200, help="повторов на каждый вариант")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if not loader.init():
+        print("❌ Не удалось загрузить данные")
+        return
+
+    engine = get_prediction_engine(loader.dataset)
+    home, away = PAIRS[0]
+
+    cases = [
+        ("до: фрейм + predict + predict_proba", lambda: legacy_predict(engine, home, away), 1),
+        ("после: массив + один predict_proba", lambda: engine.predict_pair_proba(home, away), 1),
+        ("predict_match (матрица вероятностей)", lambda: engine.predict_match(home, away), 1),
+        (f"predict_matches, тур из {len(PAIRS)} игр", lambda: engine.predict_matches(PAIRS), len(PAIRS)),
+    ]
+
+    print(f"⏱ Задержка одного прогноза, мс (повторов: {args.repeat}, n_jobs прогноза={engine.model.n_jobs})")
+    print(f"{'вариант':<42}{'медиана':>10}{'p95':>10}")
+    for name, func, calls in cases:
+        result = measure(func, args.repeat, calls)
+        print(f"{name:<42}{result['median_ms']:>10.3f}{result['p95_ms']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
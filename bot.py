@@ -5,6 +5,7 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
 
 from app.data_loader import loader
+from app.executor import executor
 from app.handlers import router
 
 load_dotenv()
@@ -17,26 +18,77 @@ if not TOKEN:
 
 async def main():
     print("📊 Загрузка данных...")
-    if not loader.load():
+    if not loader.init():
         print("❌ Не удалось загрузить данные! Проверьте файл data/KHL_v1.csv")
         return
     
     print(f"✅ Данные загружены: {len(loader.df)} игр, {len(loader.teams)} команд")
     
-    from app.prediction_engine import PredictionEngine
+    from app.prediction_engine import get_prediction_engine, update_prediction_engine
     from app.stats_calculator import StatsCalculator
     from app.ai_open_bot import KHL_AIBot
+    from app.plot_generator import PlotGenerator
     
-    global prediction_engine, calculator, ai_open_bot
-    prediction_engine = PredictionEngine(loader.df)
-    calculator = StatsCalculator(loader.df)
-    ai_open_bot = KHL_AIBot()
+    global prediction_engine, calculator, plot_generator, ai_open_bot
+    prediction_engine = get_prediction_engine(loader.dataset)
+    calculator = StatsCalculator(loader.dataset)
+    plot_generator = PlotGenerator(calculator)
+    ai_open_bot = KHL_AIBot(calculator, prediction_engine)
 
     from app import handlers
     handlers.prediction_engine = prediction_engine
     handlers.calculator = calculator
+    handlers.plot_generator = plot_generator
     handlers.ai_open_bot = ai_open_bot
     
+    # Таблицы и топы считаются в фоне, пока бот уже принимает сообщения
+    from app.warmup import keep_warm, warm_up_cache
+    warmup_task = asyncio.create_task(keep_warm(lambda: handlers.calculator))
+    
+    # Обновление данных без перезапуска. Дописанные матчи (в CSV или через loader.append_matches):
+    # куб и индексы дополняются только новыми строками, кэш сбрасывается по затронутым командам и сезонам,
+    # модель дообучается несколькими деревьями (warm_start).
+    # Изменённый CSV: полная пересборка в фоновом потоке и подмена калькулятора и модели; запросы,
+    # начатые до подмены, дорабатывают на прежних объектах, а их записи кэша — со старым поколением в ключе
+    from app.csv_watcher import CsvWatcher
+    from app.simple_cache import invalidate_tags
+    loop = asyncio.get_running_loop()
+    
+    def on_data_updated(old_dataset, new_dataset, report):
+        current = handlers.calculator
+        if not report['reload'] and current.dataset is old_dataset:
+            new_calculator = current.with_appended(new_dataset)
+        else:
+            new_calculator = StatsCalculator(new_dataset)
+        
+        if report['reload']:
+            # Калькулятор и модель подменяются вместе
+            new_engine = get_prediction_engine(new_dataset)
+            handlers.prediction_engine = new_engine
+            ai_open_bot.prediction_engine = new_engine
+        
+        handlers.calculator = new_calculator
+        plot_generator.calculator = new_calculator
+        ai_open_bot.set_calculator(new_calculator)
+        
+        if report['reload']:
+            print(f"🔄 Данные перезагружены: {len(new_dataset)} игр, версия {new_dataset.version}")
+        else:
+            tags = set(report['teams']) | {str(season) for season in report['seasons']} | {"all"}
+            # С версией: вычисления по прежнему калькулятору, ещё идущие в пуле, не вернут в кэш старые значения
+            removed = invalidate_tags(tags, version=new_dataset.version)
+            print(f"➕ Новых матчей: {report['added']}, сброшено записей кэша: {removed}")
+        asyncio.run_coroutine_threadsafe(warm_up_cache(new_calculator), loop)
+        
+        if not report['reload']:
+            # Статистика уже обновлена; модель дообучается следом и подменяется, когда готова
+            new_engine = update_prediction_engine(handlers.prediction_engine, new_dataset)
+            handlers.prediction_engine = new_engine
+            ai_open_bot.prediction_engine = new_engine
+    
+    loader.subscribe(on_data_updated)
+    watcher_task = asyncio.create_task(CsvWatcher(loader).watch())
+    
     bot = Bot(token=TOKEN)
     storage = MemoryStorage()
     dp = Dispatcher(storage=storage)
@@ -53,7 +105,11 @@ async def main():
     except Exception as e:
         print(f"❌ Возникла ошибка при работе бота: {e}")
     finally:
+        warmup_task.cancel()
+        watcher_task.cancel()
         await bot.session.close()
+        await ai_open_bot.aclose()
+        executor.shutdown(wait=False)
         print("🔌 Сессия бота закрыта")
 
 if __name__ == "__main__":
@@ -34,4 +34,44 @@ TEAM_NAMES = {
     'HC Lev': 'Лев🦁',
     'MVD Balashikha': 'Хк МВД🚔',
     'Khimik': 'Химик Воскресенск🧪'
-}
\ No newline at end of file
+}
+
+# Разговорные названия и прозвища клубов (ключи — названия из данных)
+TEAM_NICKNAMES = {
+    'CSKA Moscow': ['цска', 'армейцы', 'cska'],
+    'SKA St. Petersburg': ['ска', 'ska', 'питерский ска'],
+    'Sp. Moscow': ['спартак', 'красно-белые', 'spartak'],
+    'Dyn. Moscow': ['динамо москва', 'бело-голубые', 'dynamo moscow'],
+    'Din. Minsk': ['динамо минск', 'зубры', 'dinamo minsk'],
+    'Dinamo Riga': ['динамо рига', 'dinamo riga'],
+    'Bars Kazan': ['ак барс', 'барсы', 'казань', 'ak bars'],
+    'Ak Bars': ['ак барс', 'барсы', 'казань', 'ak bars'],
+    'Lokomotiv Yaroslavl': ['локомотив', 'локо', 'железнодорожники', 'ярославль'],
+    'Avangard Omsk': ['авангард', 'ястребы', 'омск'],
+    'Metallurg Magnitogorsk': ['магнитка', 'металлург магнитогорск', 'магнитогорск'],
+    'Metallurg Novokuznetsk': ['металлург новокузнецк', 'новокузнецк'],
+    'Salavat Ufa': ['салават', 'салават юлаев', 'уфа'],
+    'Tractor Chelyabinsk': ['трактор', 'челябинск'],
+    'Sibir Novosibirsk': ['сибирь', 'новосибирск'],
+    'Amur Khabarovsk': ['амур', 'хабаровск'],
+    'Cherepovets': ['северсталь', 'череповец'],
+    'Severstal Cherepovets': ['северсталь', 'череповец'],
+    'Niznekamsk': ['нефтехимик', 'нижнекамск'],
+    'Yekaterinburg': ['автомобилист', 'екатеринбург'],
+    'Avtomobilist Yekaterinburg': ['автомобилист', 'екатеринбург'],
+    'Vladivostok': ['адмирал', 'владивосток'],
+    'Admiral Vladivostok': ['адмирал', 'владивосток'],
+    'Nizhny Novgorod': ['торпедо', 'нижний новгород'],
+    'Torpedo Nizhny Novgorod': ['торпедо', 'нижний новгород'],
+    'Podolsk': ['витязь', 'подольск'],
+    'Vityaz Podolsk': ['витязь', 'подольск'],
+    'Sochi': ['сочи'],
+    'HC Sochi': ['сочи'],
+    'Kunlun': ['куньлунь'],
+    'Kunlun Red Star': ['куньлунь'],
+    'Barys Nur-Sultan': ['барыс', 'астана'],
+    'HC Yugra': ['югра'],
+    'Lada': ['лада', 'тольятти'],
+    'MVD Balashikha': ['мвд'],
+    'Atlant Mytishi': ['атлант'],
+}